@@ -95,6 +95,15 @@ _GROUP.add_argument(
         "if they have the same names as those that ModelCraft will produce."
     ),
 )
+_GROUP.add_argument(
+    "--resume",
+    action="store_true",
+    help=(
+        "Continue a run that was interrupted, e.g. on a pre-empted node, "
+        "from the last completed cycle saved in the output directory. "
+        "The other arguments must be the same as for the interrupted run."
+    ),
+)
 _GROUP.add_argument(
     "--restraints",
     metavar="X",
@@ -119,6 +128,82 @@ _GROUP.add_argument(
         "if not using the full --keep-files argument."
     ),
 )
+_GROUP.add_argument(
+    "--scratch-dir",
+    metavar="X",
+    help=(
+        "An existing directory on fast local storage (e.g. /dev/shm or a local SSD) "
+        "for the working directories of intermediate programs. "
+        "A unique subdirectory is created inside it and removed at the end. "
+        "Files kept with --keep-files or --keep-logs are moved "
+        "to the output directory after each program finishes."
+    ),
+)
+_GROUP.add_argument(
+    "--spool-dir",
+    metavar="X",
+    help=(
+        "A directory shared with other nodes where programs are submitted "
+        "instead of being run locally. "
+        "They are run by modelcraft-worker processes watching the same directory. "
+        "The output directory does not need to be shared. "
+        "Jobs whose worker stops responding are submitted again once. "
+        "Program output is not watched while spooled jobs run, "
+        "so --refmac-tolerance has no effect."
+    ),
+)
+_GROUP.add_argument(
+    "--trace",
+    action="store_true",
+    help=(
+        "Record a timeline of the cycles, stages, programs and slower Python steps "
+        "and write it to modelcraft.trace.json in the Chrome trace event format, "
+        "which can be opened in Perfetto (ui.perfetto.dev) or chrome://tracing."
+    ),
+)
+_GROUP.add_argument(
+    "--metrics-file",
+    metavar="X",
+    help=(
+        "Path to a Prometheus text file (ending in .prom) to update while running, "
+        "e.g. in the directory read by the node exporter textfile collector. "
+        "It includes the current cycle, running programs, time per program, "
+        "job counts and failures, peak memory and the best R-free or FSC so far."
+    ),
+)
+_GROUP.add_argument(
+    "--job-timeout",
+    type=float,
+    metavar="X",
+    help=(
+        "Maximum time in minutes for any single program to run. "
+        "Programs that run for longer are killed and the pipeline stops."
+    ),
+)
+_GROUP.add_argument(
+    "--job-idle-timeout",
+    type=float,
+    metavar="X",
+    help=(
+        "Maximum time in minutes that a program can run without writing any output. "
+        "Programs that appear to have hung are killed and the pipeline stops."
+    ),
+)
+_GROUP.add_argument(
+    "--time-budget",
+    type=float,
+    metavar="X",
+    help=(
+        "Maximum wall-clock time in minutes for the whole run. "
+        "Before each cycle, its length is predicted from the stage times "
+        "in earlier cycles. "
+        "If it would not finish in time then the cycle is shortened "
+        "(in X-ray mode by skipping pruning, dummy atoms and waters) "
+        "or the pipeline stops early with the best model so far. "
+        "Programs that are already running are not stopped, "
+        "so use --job-timeout as well for a hard limit."
+    ),
+)
 _GROUP.add_argument(
     "--threads",
     default=np.clip((os.cpu_count() or 1) - 1, 1, 4),
@@ -129,6 +214,43 @@ _GROUP.add_argument(
         "Currently only affects some internal steps of Buccaneer."
     ),
 )
+_GROUP.add_argument(
+    "--parallel-jobs",
+    default=1,
+    type=int,
+    metavar="X",
+    help=(
+        "The maximum number of programs to run at the same time. "
+        "Values above 1 allow independent steps to run concurrently, "
+        "such as protein and nucleic-acid building in the X-ray pipeline. "
+        "When building concurrently, NucleoFind uses the current map "
+        "instead of the map from the Buccaneer model. "
+        "Concurrent steps are driven by threads in one process, "
+        "and each step runs its programs as separate processes."
+    ),
+)
+_GROUP.add_argument(
+    "--cache-dir",
+    metavar="X",
+    help=(
+        "Directory for a persistent cache of program outputs. "
+        "Programs that are run again with identical inputs and options "
+        "(e.g. when repeating a run on the same data) "
+        "will reuse the cached outputs instead of running. "
+        "The cache can be shared between runs "
+        "and inspected or pruned with the modelcraft-cache script."
+    ),
+)
+_GROUP.add_argument(
+    "--cache-size",
+    default=20.0,
+    type=float,
+    metavar="X",
+    help=(
+        "Maximum size of the --cache-dir cache in gigabytes. "
+        "The least recently used outputs are removed when it grows larger."
+    ),
+)
 _GROUP.add_argument(
     "--output-nucleofind-maps",
     action="store_true",
@@ -223,6 +345,92 @@ _GROUP.add_argument(
         "Only use this option if you are sure your crystal is twinned."
     ),
 )
+_GROUP.add_argument(
+    "--refmac-tolerance",
+    type=float,
+    metavar="X",
+    help=(
+        "Stop each Refmac run early once R-free has changed by less than this amount "
+        "(e.g. 0.001) in each of the last two cycles. "
+        "By default, Refmac always runs the full number of cycles."
+    ),
+)
+_GROUP.add_argument(
+    "--adaptive-refmac-cycles",
+    nargs=2,
+    type=int,
+    metavar=("MIN", "MAX"),
+    help=(
+        "Choose the number of Refmac cycles for each step of the pipeline "
+        "(e.g. after Buccaneer, pruning or adding waters) "
+        "from how many cycles R-free took to converge in earlier runs of that step, "
+        "between MIN and MAX cycles. "
+        "R-free has converged once it changes by less than --refmac-tolerance "
+        "(or 0.001 if not set). "
+        "The decisions are recorded in the report. "
+        "By default, each step uses a fixed number of cycles."
+    ),
+)
+_GROUP.add_argument(
+    "--min-stage-gain",
+    type=float,
+    metavar="X",
+    help=(
+        "Skip pruning, dummy atoms and waters for a while if they have improved "
+        "R-free by less than this amount per minute of run time "
+        "(e.g. 0.0005) in two runs in a row. "
+        "A skipped stage is tried again after two cycles "
+        "and skipped for twice as long each time it is still unproductive. "
+        "The gain and time of each run are recorded in the report. "
+        "By default, every stage runs in every cycle."
+    ),
+)
+_GROUP.add_argument(
+    "--resolution-ramp",
+    type=float,
+    metavar="X",
+    help=(
+        "Build the early cycles against data truncated to a resolution of X A "
+        "(e.g. 3.0), which makes them faster for high-resolution data. "
+        "The limit steps to halfway and then to the full data "
+        "as R-free falls below 45%% and 38%%, "
+        "or whenever R-free stops improving at the current limit. "
+        "If the last cycle is not at the full resolution then the model "
+        "is refined against the full data at the end. "
+        "By default, all cycles use the full data."
+    ),
+)
+_GROUP.add_argument(
+    "--build-trials",
+    type=int,
+    default=1,
+    metavar="N",
+    help=(
+        "Number of Buccaneer runs (each followed by Refmac) in each cycle, "
+        "between 1 and 4. "
+        "Buccaneer has no random seed, so the runs start from different conditions "
+        "(extending the current model, building from scratch, "
+        "a 2.5 A resolution limit and using the phases without the current map) "
+        "and the one with the lowest R-free is kept. "
+        "Conditions that would repeat the default run are left out, "
+        "such as the resolution limit for data at 2.5 A or worse. "
+        "They run at the same time if --parallel-jobs allows."
+    ),
+)
+_GROUP.add_argument(
+    "--result-memory",
+    type=float,
+    metavar="X",
+    help=(
+        "Memory in gigabytes for the refinement results held by the pipeline "
+        "(e.g. the latest and best models with their reflections). "
+        "Above this, older results are written to files "
+        "in the output (or --scratch-dir) directory and read back when needed. "
+        "The current model and its reflections always stay in memory, "
+        "so this is not a limit on the total memory use. "
+        "By default, all results are kept in memory."
+    ),
+)
 _GROUP.add_argument(
     "--basic",
     action="store_true",
@@ -242,6 +450,21 @@ _GROUP.add_argument(
     action="store_true",
     help="Disable both the residue and chain pruning steps.",
 )
+_GROUP.add_argument(
+    "--parrot-solvent-sweep",
+    type=int,
+    default=1,
+    metavar="N",
+    help=(
+        "If the number of copies in the asymmetric unit is not given "
+        "in the contents, run Parrot at the same time with the solvent contents "
+        "for the N most likely numbers of copies (by Matthews probability) "
+        "and keep the one whose map is most skewed in the region "
+        "that all of the runs treat as protein. "
+        "The chosen solvent content is used for Parrot in later cycles. "
+        "By default, only the most likely number of copies is used."
+    ),
+)
 _GROUP.add_argument(
     "--disable-parrot",
     action="store_true",
@@ -323,9 +546,61 @@ _GROUP.add_argument(
     ),
 )
 
+_BATCH = _SUB_PARSERS.add_parser("batch", formatter_class=_FORMATTER)
+_GROUP = _BATCH.add_argument_group("required arguments (batch)")
+_GROUP.add_argument(
+    "manifest",
+    help=(
+        "A CSV or JSON file with one dataset per row or entry. "
+        "CSV files need a header row with 'mode' (xray or em), "
+        "an optional 'name' and other columns named after the xray or em arguments "
+        "(e.g. data, contents, cycles). "
+        "Empty cells are skipped, flags are given as true or false "
+        "and arguments with several values (e.g. half-maps) are separated by spaces. "
+        "JSON files contain a list of objects in the same format "
+        "or lists of command-line arguments starting with the mode. "
+        "Relative paths are relative to the current directory."
+    ),
+)
+_GROUP = _BATCH.add_argument_group("optional arguments (batch)")
+_GROUP.add_argument(
+    "--directory",
+    default="modelcraft-batch",
+    metavar="X",
+    help=(
+        "Directory for the output. "
+        "Each dataset without a --directory of its own "
+        "is written to a subdirectory named after it, "
+        "its log is written to name.log "
+        "and a summary of all datasets is written to summary.csv."
+    ),
+)
+_GROUP.add_argument(
+    "--parallel-datasets",
+    default=2,
+    type=int,
+    metavar="X",
+    help="The number of datasets to run at the same time in one process.",
+)
+_GROUP.add_argument(
+    "--parallel-jobs",
+    default=os.cpu_count() or 1,
+    type=int,
+    metavar="X",
+    help=(
+        "The maximum number of programs to run at the same time "
+        "across all datasets. "
+        "The --parallel-jobs argument of each dataset still controls "
+        "how many stages of that dataset can run at the same time."
+    ),
+)
+
 
 def parse(arguments: Optional[List[str]] = None) -> argparse.Namespace:
     args = _PARSER.parse_args(arguments)
+    if args.mode == "batch":
+        _check_batch(args)
+        return args
     _basic_check(args)
     _check_paths(args)
     args.contents = AsuContents.from_file(args.contents)
@@ -341,10 +616,41 @@ def _basic_check(args: argparse.Namespace):
         _PARSER.error("--cycles must be greater than 0")
     if args.threads < 1 or args.threads > (os.cpu_count() or 1):
         _PARSER.error(f"--threads must be between 1 and {(os.cpu_count() or 1)}")
+    if args.parallel_jobs < 1:
+        _PARSER.error("--parallel-jobs must be greater than 0")
+    if args.cache_size <= 0:
+        _PARSER.error("--cache-size must be greater than 0")
+    for option in (
+        "job_timeout",
+        "job_idle_timeout",
+        "time_budget",
+        "result_memory",
+        "resolution_ramp",
+    ):
+        value = getattr(args, option, None)
+        if value is not None and value <= 0:
+            _PARSER.error(f"--{option.replace('_', '-')} must be greater than 0")
+    if getattr(args, "adaptive_refmac_cycles", None) is not None:
+        minimum, maximum = args.adaptive_refmac_cycles
+        if minimum < 1 or maximum < minimum:
+            _PARSER.error("--adaptive-refmac-cycles needs 0 < MIN <= MAX")
+    if getattr(args, "parrot_solvent_sweep", 1) < 1:
+        _PARSER.error("--parrot-solvent-sweep must be greater than 0")
+    if not 1 <= getattr(args, "build_trials", 1) <= 4:
+        _PARSER.error("--build-trials must be between 1 and 4")
     if args.mode == "em" and args.resolution <= 0:
         _PARSER.error("--resolution must be greater than 0")
 
 
+def _check_batch(args: argparse.Namespace):
+    if not os.path.exists(args.manifest):
+        _PARSER.error(f"File not found: {args.manifest}")
+    if args.parallel_datasets < 1:
+        _PARSER.error("--parallel-datasets must be greater than 0")
+    if args.parallel_jobs < 1:
+        _PARSER.error("--parallel-jobs must be greater than 0")
+
+
 def _check_paths(args: argparse.Namespace):
     for arg in (
         "build_map",
@@ -354,7 +660,9 @@ def _check_paths(args: argparse.Namespace):
         "mask",
         "model",
         "restraints",
+        "scratch_dir",
         "single_map",
+        "spool_dir",
     ):
         if hasattr(args, arg):
             attr = getattr(args, arg)
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import shutil
+import threading
+from typing import Callable, List, Optional
+
+import gemmi
+import numpy
+
+from .reflections import DataItem, write_mtz
+from .structure import write_mmcif
+from .utils import puid
+
+
+class ArtifactStore:
+    "Job input files written once per content and hard-linked into job directories"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def link_mtz(
+        self, path: str, items: List[DataItem], labels: Optional[List[str]] = None
+    ) -> None:
+        sha = hashlib.sha256()
+        for item, label in zip(items, labels or [None] * len(items)):
+            _update(sha, label)
+            if item is not None:
+                _update(sha, item.cell.parameters, item.spacegroup.hm, item.types)
+                _update(sha, item.column_labels())
+                _update_array(sha, numpy.array(item, copy=False))
+        write = lambda dst: write_mtz(dst, items, labels)  # noqa: E731
+        self._link(path, sha.hexdigest() + ".mtz", write)
+
+    def link_map(self, path: str, ccp4_map: gemmi.Ccp4Map) -> None:
+        grid = ccp4_map.grid
+        sha = hashlib.sha256()
+        spacegroup = grid.spacegroup.hm if grid.spacegroup else None
+        _update(sha, grid.unit_cell.parameters, spacegroup, grid.shape)
+        _update_array(sha, numpy.array(grid, copy=False))
+        self._link(path, sha.hexdigest() + ".ccp4", ccp4_map.write_ccp4_map)
+
+    def link_mmcif(self, path: str, structure: gemmi.Structure) -> None:
+        temp = os.path.join(self.directory, f"tmp_{puid()}.cif")
+        write_mmcif(temp, structure)
+        sha = hashlib.sha256()
+        with open(temp, "rb") as stream:
+            for chunk in iter(lambda: stream.read(1 << 20), b""):
+                sha.update(chunk)
+        self._link(path, sha.hexdigest() + ".cif", lambda dst: os.rename(temp, dst))
+        if os.path.exists(temp):
+            os.remove(temp)
+
+    def size(self) -> int:
+        return sum(
+            os.path.getsize(os.path.join(self.directory, name))
+            for name in os.listdir(self.directory)
+        )
+
+    def remove(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def prune(self) -> None:
+        "Remove stored files that are no longer linked into any job directory"
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.startswith("tmp_"):
+                continue
+            stored = os.path.join(self.directory, name)
+            with self._lock_for(name):
+                try:
+                    if os.stat(stored).st_nlink == 1:
+                        os.remove(stored)
+                except FileNotFoundError:
+                    pass
+
+    def _lock_for(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _link(self, path: str, name: str, write: Callable[[str], None]) -> None:
+        stored = os.path.join(self.directory, name)
+        with self._lock_for(name):
+            if not os.path.exists(stored):
+                temp = os.path.join(self.directory, f"tmp_{puid()}")
+                write(temp)
+                os.chmod(temp, 0o444)
+                os.rename(temp, stored)
+            try:
+                os.link(stored, path)
+            except OSError:
+                shutil.copyfile(stored, path)
+
+
+def _update(sha, *parts) -> None:
+    for part in parts:
+        sha.update(repr(part).encode("utf-8"))
+
+
+def _update_array(sha, array: numpy.ndarray) -> None:
+    "Hash the array data without copying it if it is stored in either order"
+    if array.flags.f_contiguous and not array.flags.c_contiguous:
+        array = array.T
+    sha.update(numpy.ascontiguousarray(array))
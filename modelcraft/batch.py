@@ -0,0 +1,233 @@
+import concurrent.futures
+import contextvars
+import csv
+import json
+import os
+import shlex
+import signal
+import sys
+import threading
+import traceback
+from typing import List, Tuple
+
+from tabulate import tabulate
+
+from .arguments import parse
+from .modelcraftem import ModelCraftEm
+from .modelcraftxray import ModelCraftXray
+from .monlib import MonLibCache
+
+_OUTPUT = contextvars.ContextVar("output", default=None)
+_SUMMARY_COLUMNS = (
+    "name",
+    "mode",
+    "status",
+    "exit_code",
+    "cycles",
+    "residues",
+    "r_work",
+    "r_free",
+    "fsc",
+    "seconds",
+    "directory",
+)
+
+
+def read_manifest(path: str) -> List[Tuple[str, List[str]]]:
+    "Names and command-line arguments of the datasets in a CSV or JSON manifest"
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as stream:
+            entries = json.load(stream)
+        if not isinstance(entries, list):
+            raise ValueError("The JSON manifest must contain a list of datasets")
+        split = False
+    else:
+        with open(path, encoding="utf-8", newline="") as stream:
+            entries = list(csv.DictReader(stream))
+        split = True
+    datasets = []
+    for index, entry in enumerate(entries, start=1):
+        if isinstance(entry, list):
+            name, arguments = f"dataset_{index}", [str(arg) for arg in entry]
+        elif isinstance(entry, dict):
+            name, arguments = _entry_arguments(entry, split)
+            name = name or f"dataset_{index}"
+        else:
+            raise ValueError(f"Dataset {index} is not a list or object")
+        if not arguments or arguments[0] not in ("xray", "em"):
+            raise ValueError(f"Dataset {index} must have a mode of xray or em")
+        datasets.append((name, arguments))
+    names = [name for name, _ in datasets]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate dataset names: {', '.join(duplicates)}")
+    return datasets
+
+
+def _entry_arguments(entry: dict, split: bool) -> Tuple[str, List[str]]:
+    options = dict(entry)
+    name = options.pop("name", None) or None
+    arguments = [str(options.pop("mode", "") or "")]
+    for key, value in options.items():
+        if value is None or value == "":
+            continue
+        option = "--" + key.strip().replace("_", "-")
+        if isinstance(value, bool) or str(value).lower() in ("true", "false"):
+            if value is True or str(value).lower() == "true":
+                arguments.append(option)
+        elif isinstance(value, list):
+            arguments += [option, *(str(item) for item in value)]
+        elif split:
+            arguments += [option, *shlex.split(value)]
+        else:
+            arguments += [option, str(value)]
+    return name, arguments
+
+
+def run_batch(args) -> int:
+    "Run the datasets in the manifest and return the exit code"
+    try:
+        datasets = read_manifest(args.manifest)
+    except ValueError as error:
+        print(f"Invalid manifest: {error}", file=sys.stderr, flush=True)
+        return 2
+    os.makedirs(args.directory, exist_ok=True)
+    batch = _Batch(args.directory, threading.BoundedSemaphore(args.parallel_jobs))
+    stdout = sys.stdout
+    stderr = sys.stderr
+    sys.stdout = _OutputRouter(stdout)
+    sys.stderr = _OutputRouter(stderr)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, batch.handle_signal)
+        signal.signal(signal.SIGTERM, batch.handle_signal)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(args.parallel_datasets) as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, batch.run, name, arguments)
+                for name, arguments in datasets
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+    finally:
+        sys.stdout = stdout
+        sys.stderr = stderr
+    rows = [[row.get(column) for column in _SUMMARY_COLUMNS] for row in batch.rows]
+    print(tabulate(rows, headers=_SUMMARY_COLUMNS), flush=True)
+    return 0 if all(row["exit_code"] == 0 for row in batch.rows) else 1
+
+
+class _Batch:
+    "Datasets sharing one process, one pool of job slots and the monomer libraries"
+
+    def __init__(self, directory: str, job_slots: threading.BoundedSemaphore):
+        self.directory = directory
+        self.job_slots = job_slots
+        self.monlibs = MonLibCache()
+        self.lock = threading.Lock()
+        self.pipelines = set()
+        self.rows = []
+
+    def run(self, name: str, arguments: List[str]) -> None:
+        if "--directory" not in arguments:
+            arguments = [*arguments, "--directory", os.path.join(self.directory, name)]
+        row = {"name": name, "mode": arguments[0]}
+        log_path = os.path.join(self.directory, f"{name}.log")
+        with open(log_path, "w", encoding="utf-8") as log:
+            token = _OUTPUT.set(log)
+            try:
+                row.update(self._run_pipeline(arguments))
+            finally:
+                _OUTPUT.reset(token)
+        print(f"{name}: {row['status']}", flush=True)
+        with self.lock:
+            self.rows.append(row)
+            self._write_summary()
+
+    def _run_pipeline(self, arguments: List[str]) -> dict:
+        try:
+            parsed_args = parse(arguments)
+            if parsed_args.mode == "em":
+                pipeline = ModelCraftEm(
+                    parsed_args, arguments, job_slots=self.job_slots
+                )
+            else:
+                pipeline = ModelCraftXray(
+                    parsed_args,
+                    arguments,
+                    job_slots=self.job_slots,
+                    monlibs=self.monlibs,
+                )
+        except SystemExit as error:
+            return {"status": "Invalid arguments", "exit_code": error.code}
+        except Exception as error:
+            traceback.print_exc(file=sys.stdout)
+            return {"status": f"Error: {error}", "exit_code": 1}
+        with self.lock:
+            self.pipelines.add(pipeline)
+        exit_code = 1
+        try:
+            try:
+                pipeline.run()
+            except TimeoutError as error:
+                print(error, flush=True)
+                pipeline.terminate(reason="Job timed out", exit_code=1)
+            except Exception as error:
+                traceback.print_exc(file=sys.stdout)
+                if not pipeline.terminating:
+                    pipeline.terminate(reason=f"Error: {error}", exit_code=1)
+        except SystemExit as error:
+            exit_code = error.code
+        finally:
+            with self.lock:
+                self.pipelines.discard(pipeline)
+        report = pipeline.report
+        final = report.get("final", {})
+        return {
+            "status": report.get("termination_reason", "Error"),
+            "exit_code": exit_code,
+            "cycles": len(report.get("cycles", [])),
+            "residues": final.get("residues"),
+            "r_work": final.get("r_work"),
+            "r_free": final.get("r_free"),
+            "fsc": final.get("fsc"),
+            "seconds": round(report["seconds"].get("total", 0)),
+            "directory": os.path.abspath(pipeline.directory),
+        }
+
+    def _write_summary(self) -> None:
+        path = os.path.join(self.directory, "summary.csv")
+        with open(path, "w", encoding="utf-8", newline="") as stream:
+            writer = csv.DictWriter(stream, fieldnames=_SUMMARY_COLUMNS)
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+    def handle_signal(self, signum, _frame):
+        "Stop all running datasets, which then finish with the signal's exit code"
+        name = signal.Signals(signum).name
+        with self.lock:
+            pipelines = list(self.pipelines)
+        for pipeline in pipelines:
+            if not pipeline.terminating:
+                try:
+                    pipeline.terminate(
+                        reason=f"Received {name}", exit_code=128 + signum
+                    )
+                except SystemExit:
+                    pass
+        sys.exit(128 + signum)
+
+
+class _OutputRouter:
+    "Standard output (or error) that is written to the log of the dataset being run"
+
+    def __init__(self, default):
+        self._default = default
+
+    def write(self, text: str) -> int:
+        return (_OUTPUT.get() or self._default).write(text)
+
+    def flush(self) -> None:
+        (_OUTPUT.get() or self._default).flush()
+
+    def __getattr__(self, name):
+        return getattr(self._default, name)
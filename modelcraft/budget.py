@@ -0,0 +1,46 @@
+import time
+from typing import Optional
+
+from .stages import StageGraph
+
+
+class TimeBudget:
+    "Wall-clock limit for a run with cycle lengths predicted from earlier stages"
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.start_time = time.time()
+        self.stage_seconds = {}
+
+    def remaining(self) -> float:
+        return self.seconds - (time.time() - self.start_time)
+
+    def record(self, graph: StageGraph) -> None:
+        "Keep the latest time of each stage, as stages get slower as models grow"
+        self.stage_seconds.update(graph.seconds)
+
+    def predict(self, graph: StageGraph) -> Optional[float]:
+        """
+        Predicted seconds to run the stages (ignoring any parallelism)
+        or None if none of them have been run before.
+        Stages that have not been run before are assumed to take the average time.
+        """
+        if not self.stage_seconds:
+            return None
+        average = sum(self.stage_seconds.values()) / len(self.stage_seconds)
+        return sum(
+            self.stage_seconds.get(stage.name, average) for stage in graph.stages
+        )
+
+    def allows(self, seconds: Optional[float]) -> bool:
+        return seconds is None or seconds <= self.remaining()
+
+
+def mean_job_seconds(report: dict, name: str) -> Optional[float]:
+    "Average time of earlier jobs with the executable name from the report"
+    seconds = [
+        job["seconds"]
+        for job in report["jobs"]
+        if job["name"] == name and job.get("seconds") is not None
+    ]
+    return sum(seconds) / len(seconds) if seconds else None
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import List, Optional
+
+from .utils import puid
+
+
+class JobCache:
+    "Job outputs keyed by a hash of the executable, arguments and input files"
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, job) -> str:
+        sha = hashlib.sha256()
+        for part in (
+            job._exe_path,
+            job._executable.version,
+            job._args,
+            job._stdin,
+            sorted(job._environ.items()),
+        ):
+            sha.update(json.dumps(part).encode("utf-8"))
+        for relpath in _relative_files(job._directory):
+            sha.update(relpath.encode("utf-8"))
+            with open(os.path.join(job._directory, relpath), "rb") as stream:
+                for chunk in iter(lambda: stream.read(1 << 20), b""):
+                    sha.update(chunk)
+        return sha.hexdigest()
+
+    def restore(self, key: str, directory: str) -> bool:
+        "Copy cached outputs into the directory and return whether there was a hit"
+        entry = self._entry_path(key)
+        try:
+            shutil.copytree(os.path.join(entry, "files"), directory, dirs_exist_ok=True)
+            os.utime(os.path.join(entry, "entry.json"))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def store(
+        self, key: str, directory: str, executable: str, seconds: float, exclude=()
+    ) -> None:
+        entry = self._entry_path(key)
+        if os.path.exists(entry):
+            return
+        temp = os.path.join(self.directory, f"tmp_{puid()}")
+        files = os.path.join(temp, "files")
+        os.makedirs(files)
+        size = 0
+        for relpath in _relative_files(directory):
+            if relpath.split(os.sep)[0] not in exclude:
+                dst = os.path.join(files, relpath)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copy2(os.path.join(directory, relpath), dst)
+                size += os.path.getsize(dst)
+        metadata = {
+            "key": key,
+            "executable": executable,
+            "seconds": seconds,
+            "created": time.time(),
+            "size": size,
+        }
+        with open(os.path.join(temp, "entry.json"), "w", encoding="utf-8") as stream:
+            json.dump(metadata, stream, indent=4)
+        try:
+            os.rename(temp, entry)
+        except OSError:
+            shutil.rmtree(temp, ignore_errors=True)
+        if self.max_bytes is not None:
+            self.prune(self.max_bytes)
+
+    def entries(self) -> List[dict]:
+        "Cache entries sorted with the least recently used first"
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name, "entry.json")
+            if name.startswith("tmp_") or not os.path.exists(path):
+                continue
+            try:
+                with open(path, encoding="utf-8") as stream:
+                    entry = json.load(stream)
+                entry["used"] = os.path.getmtime(path)
+            except (FileNotFoundError, ValueError):
+                continue
+            entries.append(entry)
+        return sorted(entries, key=lambda entry: entry["used"])
+
+    def size(self) -> int:
+        return sum(entry["size"] for entry in self.entries())
+
+    def prune(self, max_bytes: int) -> int:
+        "Remove least recently used entries until the cache fits and return the count"
+        entries = self.entries()
+        total = sum(entry["size"] for entry in entries)
+        removed = 0
+        for entry in entries:
+            if total <= max_bytes:
+                break
+            self.remove(entry["key"])
+            total -= entry["size"]
+            removed += 1
+        return removed
+
+    def remove(self, key: str) -> None:
+        shutil.rmtree(self._entry_path(key), ignore_errors=True)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+
+def job_cache(args) -> Optional[JobCache]:
+    "Cache from the --cache-dir and --cache-size arguments (if set)"
+    if args.cache_dir is None:
+        return None
+    return JobCache(args.cache_dir, max_bytes=int(args.cache_size * 1e9))
+
+
+def _relative_files(directory: str) -> List[str]:
+    relpaths = []
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            relpaths.append(os.path.relpath(path, directory))
+    return sorted(relpaths)
@@ -0,0 +1,122 @@
+import dataclasses
+import importlib
+import json
+import os
+import shutil
+from typing import Optional
+
+import gemmi
+
+from .lazy import peek
+from .maps import read_map
+from .reflections import DataItem, write_mtz
+from .structure import read_structure, write_mmcif
+from .utils import puid
+
+
+class Checkpoint:
+    "Pipeline state saved at cycle boundaries so that a run can be resumed"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def save(self, name: str, state: dict) -> None:
+        "Replace the named state, keeping the previous one until the new one is saved"
+        path = os.path.join(self.directory, name)
+        temp = os.path.join(self.directory, f"tmp_{puid()}")
+        os.makedirs(temp)
+        encoded = _Encoder(temp).encode(state)
+        with open(os.path.join(temp, "state.json"), "w", encoding="utf-8") as stream:
+            json.dump(encoded, stream, indent=4)
+        old = f"{path}.old"
+        if os.path.exists(path):
+            os.rename(path, old)
+        os.rename(temp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def load(self, name: str) -> Optional[dict]:
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            path = f"{path}.old"
+        try:
+            with open(os.path.join(path, "state.json"), encoding="utf-8") as stream:
+                encoded = json.load(stream)
+        except FileNotFoundError:
+            return None
+        return _decode(encoded, path)
+
+    def remove(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class _Encoder:
+    "Writes structures, reflections and maps to files and everything else to JSON"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.written = {}
+        self.values = []  # Keeps lazily read values alive so their ids are not reused
+
+    def encode(self, value):
+        if isinstance(value, (list, tuple)):
+            return [self.encode(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.encode(item) for key, item in value.items()}
+        if dataclasses.is_dataclass(value):
+            fields = {
+                field.name: self.encode(peek(value, field.name))
+                for field in dataclasses.fields(value)
+            }
+            cls = type(value)
+            return {"__type__": "dataclass", "class": _class_path(cls), **fields}
+        for type_, extension, write in (
+            (gemmi.Structure, "cif", write_mmcif),
+            (DataItem, "mtz", lambda path, item: write_mtz(path, [item])),
+            (gemmi.Mtz, "mtz", lambda path, mtz: mtz.write_to_file(path)),
+            (gemmi.Ccp4Map, "ccp4", lambda path, ccp4: ccp4.write_ccp4_map(path)),
+        ):
+            if isinstance(value, type_):
+                if id(value) not in self.written:
+                    filename = f"{len(self.written) + 1}.{extension}"
+                    write(os.path.join(self.directory, filename), value)
+                    self.written[id(value)] = filename
+                    self.values.append(value)
+                name = type_.__name__
+                return {"__type__": name, "path": self.written[id(value)]}
+        return value
+
+
+def _decode(value, directory: str):
+    if isinstance(value, list):
+        return [_decode(item, directory) for item in value]
+    if not isinstance(value, dict):
+        return value
+    type_ = value.get("__type__")
+    if type_ is None:
+        return {key: _decode(item, directory) for key, item in value.items()}
+    if type_ == "dataclass":
+        module_name, _, class_name = value["class"].rpartition(".")
+        cls = getattr(importlib.import_module(module_name), class_name)
+        fields = {
+            field.name: _decode(value[field.name], directory)
+            for field in dataclasses.fields(cls)
+        }
+        return cls(**fields)
+    return _READERS[type_](os.path.join(directory, value["path"]))
+
+
+def _read_data_item(path: str) -> DataItem:
+    mtz = gemmi.read_mtz_file(path)
+    return DataItem(mtz, list(mtz.columns)[3:])
+
+
+_READERS = {
+    "Structure": read_structure,
+    "DataItem": _read_data_item,
+    "Mtz": gemmi.read_mtz_file,
+    "Ccp4Map": read_map,
+}
+
+
+def _class_path(cls) -> str:
+    return f"{cls.__module__}.{cls.__qualname__}"
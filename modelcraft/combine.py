@@ -3,8 +3,10 @@ import gemmi
 from .jobs.refmac import RefmacResult
 from .monlib import MonLib
 from .structure import remove_isolated_fragments
+from .trace import traced
 
 
+@traced()
 def combine_results(
     buccaneer: RefmacResult, nautilus: RefmacResult, monlib: MonLib
 ) -> gemmi.Structure:
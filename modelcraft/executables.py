@@ -0,0 +1,92 @@
+import concurrent.futures
+import hashlib
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional
+
+_VERSION = re.compile(r"version\s*:?\s*v?(\d+(?:\.\w+)+)", re.IGNORECASE)
+_NUMBER = re.compile(r"\d+\.\d+(?:\.\w+)*")
+
+
+class Executable:
+    "A program found on the PATH with a version that is probed when first needed"
+
+    def __init__(self, name: str, path: Optional[str]):
+        self.name = name
+        self.path = path
+        self._version = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> Optional[str]:
+        if self.path is None:
+            return None
+        with self._lock:
+            if self._version is None:
+                self._version = _probe_version(self.path)
+            return self._version
+
+
+class ExecutableRegistry:
+    "Executables resolved once and shared by all jobs"
+
+    def __init__(self):
+        self._executables: Dict[str, Executable] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Executable:
+        with self._lock:
+            if name not in self._executables:
+                self._executables[name] = Executable(name, shutil.which(name))
+            return self._executables[name]
+
+    def check(self, names: Iterable[str]) -> List[str]:
+        "Resolve and probe the executables in parallel and return any that are missing"
+        executables = [self.get(name) for name in names]
+        with concurrent.futures.ThreadPoolExecutor() as pool:
+            list(pool.map(lambda executable: executable.version, executables))
+        return [executable.name for executable in executables if not executable.path]
+
+    def report(self) -> dict:
+        with self._lock:
+            executables = list(self._executables.values())
+        return {
+            executable.name: {"path": executable.path, "version": executable.version}
+            for executable in sorted(executables, key=lambda e: e.name)
+        }
+
+
+EXECUTABLES = ExecutableRegistry()
+
+
+def _probe_version(path: str) -> str:
+    "Version reported by the program (if any) and a digest of the executable file"
+    sha = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for chunk in iter(lambda: stream.read(1 << 20), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()[:12]
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            process = subprocess.run(
+                [path, "--version"],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                cwd=directory,
+                timeout=60,
+                check=False,
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return digest
+    output = process.stdout.decode("utf-8", errors="replace")[:10000]
+    match = _VERSION.search(output)
+    if match:
+        return f"{match.group(1)} ({digest})"
+    match = _NUMBER.search(output)
+    if match:
+        return f"{match.group(0)} ({digest})"
+    return digest
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Optional
+
+from .utils import puid
+
+SPOOL_FOLDERS = ("tmp", "pending", "running", "done")
+
+
+class LocalExecutor:
+    "Run job programs as subprocesses of the pipeline"
+
+    def run(self, job) -> None:
+        job._run_subprocess()
+
+    async def run_async(self, job) -> None:
+        await job._run_subprocess_async()
+
+    def cancel(self) -> None:
+        pass
+
+
+class SpoolExecutor:
+    """
+    Run job programs with modelcraft-worker processes watching a shared directory.
+    Workers touch the directory of each running job as a heartbeat.
+    A job whose worker stops doing so (e.g. on a pre-empted node) is submitted
+    again up to a number of retries and then fails.
+    A job still running the grace period after its timeout is cancelled here
+    in case its worker can no longer enforce the limit.
+    The output of spooled jobs is not watched while they run,
+    so Refmac cannot be stopped early once R-free converges.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        poll_seconds: float = 1.0,
+        *,
+        stale_seconds: float = 120.0,
+        grace_seconds: float = 60.0,
+        retries: int = 1,
+    ):
+        self.directory = os.path.abspath(directory)
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self.grace_seconds = grace_seconds
+        self.retries = retries
+        self._tickets = set()
+        self._lock = threading.Lock()
+        self._cancelled = False
+        for folder in SPOOL_FOLDERS:
+            os.makedirs(self._path(folder), exist_ok=True)
+
+    def run(self, job) -> None:
+        ticket = _Ticket()
+        self._submit(job, ticket)
+        try:
+            while not self._finished(job, ticket):
+                time.sleep(self.poll_seconds)
+        finally:
+            with self._lock:
+                self._tickets.discard(ticket)
+        job._check_stopped()
+
+    async def run_async(self, job) -> None:
+        ticket = _Ticket()
+        self._submit(job, ticket)
+        try:
+            while not self._finished(job, ticket):
+                await asyncio.sleep(self.poll_seconds)
+        finally:
+            with self._lock:
+                self._tickets.discard(ticket)
+        job._check_stopped()
+
+    def cancel(self) -> None:
+        "Withdraw jobs that have not started and ask workers to kill the rest"
+        self._cancelled = True
+        with self._lock:
+            tickets = list(self._tickets)
+        for ticket in tickets:
+            withdrawn = self._path("tmp", f"{ticket.name}_cancelled")
+            try:
+                os.rename(self._path("pending", ticket.name), withdrawn)
+                shutil.rmtree(withdrawn, ignore_errors=True)
+            except FileNotFoundError:
+                try:
+                    open(self._path("running", ticket.name, "cancel"), "w").close()
+                except FileNotFoundError:
+                    pass
+
+    def _submit(self, job, ticket: "_Ticket") -> None:
+        # Names start with the submission time so workers can claim the oldest first
+        name = os.path.basename(job._directory)
+        ticket.name = f"{time.time_ns():020d}_{name}_{puid()}"
+        ticket.started = None
+        temp = self._path("tmp", ticket.name)
+        shutil.copytree(job._directory, temp)
+        limits = {"timeout": job._timeout, "idle_timeout": job._idle_timeout}
+        with open(os.path.join(temp, "ticket.json"), "w", encoding="utf-8") as stream:
+            json.dump(limits, stream)
+        with self._lock:
+            self._tickets.add(ticket)
+        os.rename(temp, self._path("pending", ticket.name))
+
+    def _finished(self, job, ticket: "_Ticket") -> bool:
+        "Collect the job if it is done, resubmit or stop it if needed, else wait"
+        if self._cancelled:
+            raise InterruptedError(f"Spooled job {ticket.name} was cancelled")
+        if os.path.isdir(self._path("done", ticket.name)):
+            self._collect(job, ticket.name)
+            return True
+        try:
+            heartbeat = os.stat(self._path("running", ticket.name)).st_mtime
+        except FileNotFoundError:
+            return False
+        now = time.time()
+        if ticket.started is None:
+            ticket.started = now
+        if now - max(heartbeat, ticket.started) > self.stale_seconds:
+            return self._resubmit(job, ticket)
+        if job._timeout is not None:
+            limit = job._timeout + self.grace_seconds
+            if now - ticket.started > limit and self._withdraw(ticket.name):
+                job._stopped_reason = f"it ran for over {job._timeout:g} seconds"
+                return True
+        return False
+
+    def _resubmit(self, job, ticket: "_Ticket") -> bool:
+        "Submit a job again after its worker stopped and return if it has failed"
+        if not self._withdraw(ticket.name):
+            return False
+        if ticket.retries >= self.retries:
+            job._stopped_reason = "its worker stopped responding"
+            return True
+        ticket.retries += 1
+        print(f"Resubmitting {ticket.name} (worker not responding)", flush=True)
+        self._submit(job, ticket)
+        return False
+
+    def _withdraw(self, name: str) -> bool:
+        "Remove a ticket that has not finished and return if it was found"
+        withdrawn = self._path("tmp", f"{name}_withdrawn")
+        for folder in ("pending", "running"):
+            try:
+                os.rename(self._path(folder, name), withdrawn)
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(withdrawn, ignore_errors=True)
+            return True
+        return False
+
+    def _collect(self, job, ticket: str) -> None:
+        done = self._path("done", ticket)
+        with open(os.path.join(done, "result.json"), encoding="utf-8") as stream:
+            result = json.load(stream)
+        inputs = set(os.listdir(job._directory)) | {"ticket.json", "result.json"}
+        shutil.copytree(
+            done,
+            job._directory,
+            ignore=lambda path, names: inputs if path == done else (),
+            dirs_exist_ok=True,
+        )
+        shutil.rmtree(done, ignore_errors=True)
+        job._resources = result.get("resources")
+        job._stopped_reason = result.get("stopped_reason")
+
+    def _path(self, *paths: str) -> str:
+        return os.path.join(self.directory, *paths)
+
+
+class _Ticket:
+    "A job submitted to the spool"
+
+    def __init__(self):
+        self.name = None
+        self.started = None
+        self.retries = 0
+
+
+def job_executor(args) -> Optional[SpoolExecutor]:
+    "Spool executor from the --spool-dir argument (if set)"
+    if args.spool_dir is None:
+        return None
+    if getattr(args, "refmac_tolerance", None) is not None:
+        print(
+            "Warning: --refmac-tolerance has no effect with --spool-dir "
+            "because the output of spooled jobs is not watched while they run",
+            flush=True,
+        )
+    return SpoolExecutor(args.spool_dir)
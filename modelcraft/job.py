@@ -1,53 +1,187 @@
 import abc
+import asyncio
+import contextlib
+import contextvars
+import functools
 import os
+import shlex
 import shutil
 import subprocess
+import sys
 import textwrap
+import threading
 import time
+from typing import List
 
-from .pipeline import Pipeline
+import gemmi
+
+from .artifacts import ArtifactStore
+from .executables import EXECUTABLES
+from .executor import LocalExecutor
+from .lazy import keep_files, load_all
+from .pipeline import PROCESS_GROUPS, Pipeline, kill_process_group
+from .reflections import DataItem, write_mtz
+from .structure import write_mmcif
+from .trace import span
 from .utils import puid
 
+_LOG_FILES = ("stdout.txt", "stderr.txt")
+
 
 class Job(abc.ABC):
     def __init__(self, executable: str):
         self._exe_name = executable
-        self._exe_path = shutil.which(executable)
+        self._exe_path = None
+        self._executable = None
         self._args = []
         self._stdin = []
         self._environ = {}
         self._directory = None
         self._seconds = None
+        self._resources = None
+        self._input_files = set()
+        self._cache_key = None
+        self._cached = False
+        self._pipeline = None
+        self._artifacts = None
+        self._timeout = None
+        self._idle_timeout = None
+        self._stopped_reason = None
+        self._process_lock = threading.RLock()
+        self._reaped = False
 
     def run(self, pipeline: Pipeline = None):
+        with span(self._exe_name, "job") as details, self._failures(pipeline):
+            self._prepare(pipeline)
+            details["directory"] = os.path.relpath(self._directory)
+            if self._restore_from_cache(pipeline):
+                details["cached"] = True
+                return self._finish(pipeline)
+            slot = contextlib.nullcontext() if pipeline is None else pipeline.job_slot()
+            with slot:
+                start_time = time.time()
+                self._executor(pipeline).run(self)
+                self._seconds = time.time() - start_time
+            return self._finish(pipeline)
+
+    async def run_async(self, pipeline: Pipeline = None):
+        span_ = span(self._exe_name, "job", lane=id(self))
+        with span_ as details, self._failures(pipeline):
+            self._prepare(pipeline)
+            details["directory"] = os.path.relpath(self._directory)
+            if self._restore_from_cache(pipeline):
+                details["cached"] = True
+                return self._finish(pipeline)
+            if pipeline is not None:
+                await pipeline.acquire_job_slot_async()
+            try:
+                start_time = time.time()
+                await self._executor(pipeline).run_async(self)
+                self._seconds = time.time() - start_time
+            finally:
+                if pipeline is not None:
+                    pipeline.release_job_slot()
+            return self._finish(pipeline)
+
+    @contextlib.contextmanager
+    def _failures(self, pipeline: Pipeline = None):
+        try:
+            yield
+        except Exception as error:
+            if pipeline is not None:
+                pipeline.report_job_failure(self._exe_name, error)
+            raise
+
+    def _prepare(self, pipeline: Pipeline = None) -> None:
+        registry = EXECUTABLES if pipeline is None else pipeline.executables
+        self._executable = registry.get(self._exe_name)
+        self._exe_path = self._executable.path
         if self._exe_path is None:
             raise ValueError(f"Executable '{self._exe_name}' not found")
         if pipeline is None:
-            self._directory = f"job_{self._exe_name}_{puid(length=20)}"
+            directory = f"job_{self._exe_name}_{puid(length=20)}"
         else:
-            self._directory = pipeline.next_job_directory(self._exe_name)
-            pipeline.report_job_start(self._exe_name)
+            directory = pipeline.next_job_directory(self._exe_name)
+            self._pipeline = pipeline
+            # Shared so that the pipeline never kills a process that has been reaped
+            self._process_lock = pipeline.lock
+            self._artifacts = pipeline.artifact_store()
+            self._timeout = pipeline.job_timeout
+            self._idle_timeout = pipeline.idle_timeout
+            pipeline.report_job_start(self._exe_name, directory)
+        # Absolute so that lazily loaded fields can be read after a change of directory
+        self._directory = os.path.abspath(directory)
         os.makedirs(self._directory, exist_ok=True)
         self._setup()
+        if pipeline is not None and pipeline.cache is not None:
+            self._input_files = set(os.listdir(self._directory))
+            self._cache_key = pipeline.cache.key(self)
         with open(self._path("script.sh"), "w", encoding="utf-8") as stream:
             stream.write(self._script())
         os.chmod(self._path("script.sh"), 0o755)
+
+    @staticmethod
+    def _executor(pipeline: Pipeline = None):
+        return LocalExecutor() if pipeline is None else pipeline.executor
+
+    def _restore_from_cache(self, pipeline: Pipeline = None) -> bool:
+        if self._cache_key is None:
+            return False
         start_time = time.time()
-        self._run_subprocess()
-        self._seconds = time.time() - start_time
+        self._cached = pipeline.cache.restore(self._cache_key, self._directory)
+        if self._cached:
+            self._seconds = time.time() - start_time
+            print("(cached)", flush=True)
+        return self._cached
+
+    def _finish(self, pipeline: Pipeline = None):
         result = self._result()
+        if self._cache_key is not None and not self._cached:
+            pipeline.cache.store(
+                key=self._cache_key,
+                directory=self._directory,
+                executable=self._exe_name,
+                seconds=self._seconds,
+                exclude=self._input_files | {"script.sh"},
+            )
         if pipeline is None:
-            self._remove_files()
-        else:
-            pipeline.report_job_finish(result)
+            load_all(result)
+            _remove_files(self._directory)
+            return result
+        pipeline.report_job_finish(self._exe_name, result, self._resources)
+        with pipeline.lock:
             pipeline.seconds[self._exe_path] += self._seconds
-            if not pipeline.keep_jobs:
-                self._remove_files(keep_logs=pipeline.keep_logs)
+        cleanup = functools.partial(
+            _clean_up_job_files, self._directory, pipeline, self._artifacts
+        )
+        files = keep_files(result, cleanup)
+        if files is not None:
+            pipeline.add_job_files(files)
         return result
 
     def _path(self, *paths: str) -> str:
         return os.path.join(self._directory, *paths)
 
+    def _write_mtz(
+        self, filename: str, items: List[DataItem], labels: List[str] = None
+    ) -> None:
+        if self._artifacts is None:
+            write_mtz(self._path(filename), items, labels)
+        else:
+            self._artifacts.link_mtz(self._path(filename), items, labels)
+
+    def _write_mmcif(self, filename: str, structure: gemmi.Structure) -> None:
+        if self._artifacts is None:
+            write_mmcif(self._path(filename), structure)
+        else:
+            self._artifacts.link_mmcif(self._path(filename), structure)
+
+    def _write_map(self, filename: str, ccp4_map: gemmi.Ccp4Map) -> None:
+        if self._artifacts is None:
+            ccp4_map.write_ccp4_map(self._path(filename))
+        else:
+            self._artifacts.link_map(self._path(filename), ccp4_map)
+
     @abc.abstractmethod
     def _setup(self) -> None:
         pass
@@ -56,7 +190,92 @@ class Job(abc.ABC):
     def _result(self):
         pass
 
+    def _watch_stdout(self, line: str) -> None:
+        "Called with each line of standard output while the program is running"
+
     def _run_subprocess(self):
+        process = self._start_process()
+        with self._monitoring(process):
+            self._wait(process)
+        self._check_stopped()
+
+    async def _run_subprocess_async(self):
+        process = await self._start_process_async()
+        with self._monitoring(process):
+            await process.wait()
+            with self._process_lock:
+                self._reaped = True
+                if self._pipeline is not None:
+                    self._pipeline.remove_process(process)
+        self._check_stopped()
+
+    @contextlib.contextmanager
+    def _monitoring(self, process: subprocess.Popen):
+        watch = type(self)._watch_stdout is not Job._watch_stdout
+        if not watch and self._timeout is None and self._idle_timeout is None:
+            yield
+            return
+        finished = threading.Event()
+        monitor = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self._monitor, process, finished, watch),
+        )
+        monitor.start()
+        try:
+            yield
+        finally:
+            finished.set()
+            monitor.join()
+
+    def _monitor(self, process, finished: threading.Event, watch: bool) -> None:
+        "Pass stdout lines to the watcher and stop the process if it runs too long"
+        start_time = last_output_time = time.time()
+        sizes = None
+        path = self._path("stdout.txt")
+        with open(path, encoding="utf-8", errors="replace") as stream:
+            partial = ""
+            while True:
+                done = finished.is_set()
+                if watch:
+                    *lines, partial = (partial + stream.read()).split("\n")
+                    for line in lines:
+                        self._watch_stdout(line)
+                if done:
+                    break
+                now = time.time()
+                new_sizes = [os.path.getsize(self._path(f)) for f in _LOG_FILES]
+                if new_sizes != sizes:
+                    sizes = new_sizes
+                    last_output_time = now
+                if self._timeout is not None and now - start_time > self._timeout:
+                    self._stop(process, f"it ran for over {self._timeout:g} seconds")
+                idle_seconds = now - last_output_time
+                if self._idle_timeout is not None and idle_seconds > self._idle_timeout:
+                    reason = f"it wrote no output for {self._idle_timeout:g} seconds"
+                    self._stop(process, reason)
+                finished.wait(0.5)
+        if partial:
+            self._watch_stdout(partial)
+
+    def _stop(self, process: subprocess.Popen, reason: str) -> None:
+        with self._process_lock:
+            if self._stopped_reason is None and not self._reaped:
+                self._stopped_reason = reason
+                kill_process_group(process)
+
+    def _check_stopped(self) -> None:
+        if self._stopped_reason is not None:
+            message = textwrap.dedent(
+                f"""
+                The job in {self._directory} was stopped
+                because {self._stopped_reason}.
+                Please check the log files for details:
+                {self._path("stdout.txt")}
+                {self._path("stderr.txt")}"""
+            )
+            raise TimeoutError(message)
+
+    def _start_process(self) -> subprocess.Popen:
         with open(self._path("stdout.txt"), "w", encoding="utf-8") as out_stream:
             with open(self._path("stderr.txt"), "w", encoding="utf-8") as err_stream:
                 process = subprocess.Popen(
@@ -67,23 +286,78 @@ class Job(abc.ABC):
                     encoding="utf8",
                     env={**os.environ, **self._environ},
                     cwd=self._directory,
+                    start_new_session=PROCESS_GROUPS,
                 )
+        if self._pipeline is not None:
+            self._pipeline.add_process(process)
         if self._stdin:
-            for line in self._stdin:
-                process.stdin.write(line + "\n")
-            process.stdin.close()
-        process.wait()
+            try:
+                for line in self._stdin:
+                    process.stdin.write(line + "\n")
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+        return process
+
+    async def _start_process_async(self) -> asyncio.subprocess.Process:
+        """
+        Like _start_process, but the event loop reaps the process,
+        so its resource usage is not recorded and it is only known to be reaped
+        once its return code is set
+        """
+        with open(self._path("stdout.txt"), "w", encoding="utf-8") as out_stream:
+            with open(self._path("stderr.txt"), "w", encoding="utf-8") as err_stream:
+                process = await asyncio.create_subprocess_exec(
+                    self._exe_path,
+                    *self._args,
+                    stdin=asyncio.subprocess.PIPE if self._stdin else None,
+                    stdout=out_stream,
+                    stderr=err_stream,
+                    env={**os.environ, **self._environ},
+                    cwd=self._directory,
+                    start_new_session=PROCESS_GROUPS,
+                )
+        if self._pipeline is not None:
+            self._pipeline.add_process(process)
+        if self._stdin:
+            try:
+                for line in self._stdin:
+                    process.stdin.write(f"{line}\n".encode("utf8"))
+                await process.stdin.drain()
+                process.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        return process
+
+    def _wait(self, process: subprocess.Popen) -> None:
+        # Where possible, wait for the exit without reaping the process and then
+        # reap it under the lock, so that its ID cannot be reused by another process
+        # before it is marked as reaped (Windows handles are never reused this way)
+        peek = hasattr(os, "waitid")
+        if peek:
+            os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        with self._process_lock if peek else contextlib.nullcontext():
+            if hasattr(os, "wait4"):
+                _, status, rusage = os.wait4(process.pid, 0)
+                process.returncode = os.waitstatus_to_exitcode(status)
+                self._resources = _resource_usage(rusage)
+            else:
+                process.wait()
+            with self._process_lock:
+                self._reaped = True
+                if self._pipeline is not None:
+                    self._pipeline.remove_process(process)
 
     def _script(self) -> str:
         script = "#!/usr/bin/env bash\n\n"
         if self._environ:
             for variable, value in self._environ.items():
-                script += f"export {variable}={value}\n"
+                script += f"export {variable}={shlex.quote(value)}\n"
             script += "\n"
-        script += self._exe_path
-        script += f" {' '.join(self._args)} \\\n> stdout.txt 2> stderr.txt"
+        script += shlex.join([self._exe_path] + self._args)
+        script += " \\\n> stdout.txt 2> stderr.txt"
         if self._stdin:
-            script += " << EOF\n"
+            script += " << 'EOF'\n"
             for line in self._stdin:
                 script += f"{line}\n"
             script += "EOF\n"
@@ -106,11 +380,42 @@ class Job(abc.ABC):
                 )
                 raise FileNotFoundError(message)
 
-    def _remove_files(self, keep_logs: bool = False) -> None:
-        if keep_logs:
-            os.makedirs("modelcraft-logs", exist_ok=True)
-            for filename in ("stdout.txt", "stderr.txt", "script.sh"):
-                src = self._path(filename)
-                dst = os.path.join("modelcraft-logs", f"{self._directory}_{filename}")
-                os.rename(src, dst)
-        shutil.rmtree(self._directory, ignore_errors=True)
+
+def _clean_up_job_files(
+    directory: str, pipeline: Pipeline, artifacts: ArtifactStore = None
+) -> None:
+    "Remove or collect the job directory once the result no longer needs its files"
+    if pipeline.scratch_directory is not None:
+        pipeline.collect_job_directory(directory)
+    elif not pipeline.keep_jobs:
+        _remove_files(directory, keep_logs=pipeline.keep_logs)
+    if artifacts is not None:
+        artifacts.prune()
+
+
+def _remove_files(directory: str, keep_logs: bool = False) -> None:
+    if keep_logs:
+        logs = os.path.join(os.path.dirname(directory), "modelcraft-logs")
+        os.makedirs(logs, exist_ok=True)
+        name = os.path.basename(directory)
+        for filename in ("stdout.txt", "stderr.txt", "script.sh"):
+            src = os.path.join(directory, filename)
+            dst = os.path.join(logs, f"{name}_{filename}")
+            os.rename(src, dst)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def _resource_usage(rusage) -> dict:
+    "Resources used by a finished child process (and any children it waited for)"
+    max_rss_kb = rusage.ru_maxrss
+    if sys.platform == "darwin":
+        max_rss_kb //= 1024
+    return {
+        "user_seconds": rusage.ru_utime,
+        "system_seconds": rusage.ru_stime,
+        "max_rss_kb": max_rss_kb,
+        "block_input": rusage.ru_inblock,
+        "block_output": rusage.ru_oublock,
+        "voluntary_context_switches": rusage.ru_nvcsw,
+        "involuntary_context_switches": rusage.ru_nivcsw,
+    }
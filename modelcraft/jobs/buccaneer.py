@@ -1,4 +1,5 @@
 import dataclasses
+import functools
 import os
 import xml.etree.ElementTree as ET
 
@@ -6,11 +7,13 @@ import gemmi
 
 from ..contents import AsuContents
 from ..job import Job
-from ..reflections import DataItem, write_mtz
+from ..lazy import Lazy, lazy_fields
+from ..reflections import DataItem
 from ..sequence import PROTEIN_CODES, PolymerType
-from ..structure import read_structure, write_mmcif
+from ..structure import read_structure
 
 
+@lazy_fields("structure")
 @dataclasses.dataclass
 class BuccaneerResult:
     structure: gemmi.Structure
@@ -41,6 +44,7 @@ class Buccaneer(Job):
         cycles: int = 2,
         threads: int = 1,
         em_mode: bool = False,
+        resolution: float = 2.0,
     ):
         super().__init__("cbuccaneer")
         self.contents = contents
@@ -56,6 +60,7 @@ class Buccaneer(Job):
         self.cycles = cycles
         self.threads = threads
         self.em_mode = em_mode
+        self.resolution = resolution
 
     def _setup(self) -> None:
         if self.em_mode:
@@ -68,7 +73,7 @@ class Buccaneer(Job):
         self.contents.write_sequence_file(self._path("seqin.seq"), types)
         self._args += ["-seqin", "seqin.seq"]
         data_items = [self.fsigf, self.phases, self.fphi, self.freer]
-        write_mtz(self._path("hklin.mtz"), data_items)
+        self._write_mtz("hklin.mtz", data_items)
         self._args += ["-mtzin", "hklin.mtz"]
         self._args += ["-colin-fo", self.fsigf.label()]
         if self.phases.types == "AAAA":
@@ -80,14 +85,14 @@ class Buccaneer(Job):
         if self.freer is not None:
             self._args += ["-colin-free", self.freer.label()]
         if self.input_structure is not None:
-            write_mmcif(self._path("xyzin.cif"), self.input_structure)
+            self._write_mmcif("xyzin.cif", self.input_structure)
             self._args += ["-pdbin", "xyzin.cif"]
             self._args += ["-model-filter"]
             self._args += ["-nonprotein-radius", "1.0"]
             for known_id in _known_structure_ids(self.input_structure):
                 self._args += ["-known-structure", known_id]
         if self.mr_structure is not None:
-            write_mmcif(self._path("xyzmr.cif"), self.mr_structure)
+            self._write_mmcif("xyzmr.cif", self.mr_structure)
             self._args += ["-pdbin-mr", "xyzmr.cif"]
             if self.use_mr:
                 self._args += ["-mr-model"]
@@ -103,7 +108,7 @@ class Buccaneer(Job):
         self._args += ["-fast"]
         self._args += ["-correlation-mode"]
         self._args += ["-anisotropy-correction"]
-        self._args += ["-resolution", "2.0"]
+        self._args += ["-resolution", str(self.resolution)]
         self._args += ["-pdbout", "xyzout.cif"]
         self._args += ["-xmlout", "xmlout.xml"]
         self._args += ["-cif"]
@@ -112,7 +117,11 @@ class Buccaneer(Job):
         self._check_files_exist("xmlout.xml")
         xml = ET.parse(self._path("xmlout.xml")).getroot()
         residues = int(xml.find("Final/ResiduesBuilt").text)
-        structure = read_structure(self._path("xyzout.cif")) if residues > 0 else None
+        structure = None
+        if residues > 0:
+            structure = Lazy(
+                functools.partial(read_structure, self._path("xyzout.cif"))
+            )
         return BuccaneerResult(
             structure=structure,
             completeness_res=float(xml.find("Final/CompletenessByResiduesBuilt").text),
@@ -3,7 +3,7 @@ import dataclasses
 import gemmi
 
 from ..job import Job
-from ..reflections import DataItem, write_mtz
+from ..reflections import DataItem
 
 
 @dataclasses.dataclass
@@ -20,8 +20,8 @@ class Comit(Job):
         self.fphi = fphi
 
     def _setup(self) -> None:
-        write_mtz(
-            path=self._path("hklin.mtz"),
+        self._write_mtz(
+            "hklin.mtz",
             items=[self.fsigf, self.fphi],
             labels=["F,SIGF", "FC,PHIC"],
         )
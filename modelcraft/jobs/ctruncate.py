@@ -3,7 +3,7 @@ import dataclasses
 import gemmi
 
 from ..job import Job
-from ..reflections import DataItem, write_mtz
+from ..reflections import DataItem
 
 
 @dataclasses.dataclass
@@ -21,7 +21,7 @@ class CTruncate(Job):
         self.observations = observations
 
     def _setup(self) -> None:
-        write_mtz(self._path("hklin.mtz"), [self.observations])
+        self._write_mtz("hklin.mtz", [self.observations])
         self._args += ["-hklin", "hklin.mtz"]
         self._args += ["-colin", f"/*/*/[{self.observations.label()}]"]
         self._args += ["-hklout", "hklout.mtz"]
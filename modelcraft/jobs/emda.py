@@ -25,7 +25,7 @@ class EmdaMapMask(Job):
         self.resolution = resolution
 
     def _setup(self) -> None:
-        self.density.write_ccp4_map(self._path("map.cpp4"))
+        self._write_map("map.cpp4", self.density)
         self._args += ["mapmask"]
         self._args += ["--map", "map.cpp4"]
         self._args += ["--knl", str(self.kernel_radius)]
@@ -3,8 +3,8 @@ import dataclasses
 import gemmi
 
 from ..job import Job
-from ..reflections import DataItem, write_mtz
-from ..structure import read_structure, write_mmcif
+from ..reflections import DataItem
+from ..structure import read_structure
 
 
 @dataclasses.dataclass
@@ -21,8 +21,8 @@ class FindWaters(Job):
         self.dummy = dummy
 
     def _setup(self) -> None:
-        write_mtz(self._path("hklin.mtz"), [self.fphi])
-        write_mmcif(self._path("xyzin.cif"), self.structure)
+        self._write_mtz("hklin.mtz", [self.fphi])
+        self._write_mmcif("xyzin.cif", self.structure)
         self._args += ["--pdbin", "xyzin.cif"]
         self._args += ["--hklin", "hklin.mtz"]
         self._args += ["--f", self.fphi.label(0)]
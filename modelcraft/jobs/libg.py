@@ -3,7 +3,6 @@ import dataclasses
 import gemmi
 
 from ..job import Job
-from ..structure import write_mmcif
 
 
 @dataclasses.dataclass
@@ -17,7 +16,7 @@ class Libg(Job):
         self.structure = structure
 
     def _setup(self) -> None:
-        write_mmcif(self._path("structure.cif"), self.structure)
+        self._write_mmcif("structure.cif", self.structure)
         self._args += ["-c", "structure.cif"]
         self._args += ["-o", "libg_restraints.txt"]
 
@@ -4,7 +4,7 @@ import xml.etree.ElementTree as ET
 import gemmi
 
 from ..job import Job
-from ..reflections import DataItem, write_mtz
+from ..reflections import DataItem
 from ..structure import read_structure
 
 
@@ -32,7 +32,7 @@ class Molrep(Job):
         self.number_of_monomers = number_of_monomers
 
     def _setup(self) -> None:
-        write_mtz(self._path("hklin.mtz"), [self.observations])
+        self._write_mtz("hklin.mtz", [self.observations])
         self.structure.write_minimal_pdb(self._path("xyzin.pdb"))
         self._args += ["-f", "hklin.mtz"]
         self._args += ["-m", "xyzin.pdb"]
@@ -1,15 +1,18 @@
 import dataclasses
+import functools
 import xml.etree.ElementTree as ET
 
 import gemmi
 
 from ..contents import AsuContents
 from ..job import Job
-from ..reflections import DataItem, write_mtz
+from ..lazy import Lazy, lazy_fields
+from ..reflections import DataItem
 from ..sequence import DNA_CODES, PolymerType
-from ..structure import read_structure, write_mmcif
+from ..structure import read_structure
 
 
+@lazy_fields("structure")
 @dataclasses.dataclass
 class NautilusResult:
     structure: gemmi.Structure
@@ -22,9 +25,9 @@ class NautilusResult:
     def __init__(self, job: Job):
         job._check_files_exist("xmlout.xml", "xyzout.cif")
         xml = ET.parse(job._path("xmlout.xml")).getroot()
-        structure = read_structure(job._path("xyzout.cif"))
-        _deoxyfy(structure)
-        self.structure = structure
+        self.structure = Lazy(
+            functools.partial(_read_structure, job._path("xyzout.cif"))
+        )
         self.fragments_built = int(xml.find("Final/FragmentsBuilt").text)
         self.residues_built = int(xml.find("Final/ResiduesBuilt").text)
         self.residues_sequenced = int(xml.find("Final/ResiduesSequenced").text)
@@ -57,7 +60,7 @@ class Nautilus(Job):
         self.contents.write_sequence_file(self._path("seqin.seq"), types)
         self._args += ["-seqin", "seqin.seq"]
         data_items = [self.fsigf, self.phases, self.fphi, self.freer]
-        write_mtz(self._path("hklin.mtz"), data_items)
+        self._write_mtz("hklin.mtz", data_items)
         self._args += ["-mtzin", "hklin.mtz"]
         self._args += ["-colin-fo", self.fsigf.label()]
         if self.phases.types == "AAAA":
@@ -69,7 +72,7 @@ class Nautilus(Job):
         if self.freer is not None:
             self._args += ["-colin-free", self.freer.label()]
         if self.structure is not None:
-            write_mmcif(self._path("xyzin.cif"), self.structure)
+            self._write_mmcif("xyzin.cif", self.structure)
             self._args += ["-pdbin", "xyzin.cif"]
         self._args += ["-cycles", str(self.cycles)]
         self._args += ["-anisotropy-correction"]
@@ -81,6 +84,12 @@ class Nautilus(Job):
         return NautilusResult(self)
 
 
+def _read_structure(path: str) -> gemmi.Structure:
+    structure = read_structure(path)
+    _deoxyfy(structure)
+    return structure
+
+
 def _deoxyfy(structure: gemmi.Structure) -> None:
     dna_codes = set(DNA_CODES.values())
     for chain in structure[0]:
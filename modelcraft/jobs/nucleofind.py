@@ -5,8 +5,7 @@ import gemmi
 from ..contents import AsuContents, PolymerType
 from ..job import Job
 from ..jobs.nautilus import NautilusResult
-from ..reflections import DataItem, write_mtz
-from ..structure import write_mmcif
+from ..reflections import DataItem
 
 
 @dataclasses.dataclass
@@ -23,7 +22,7 @@ class NucleoFindPredict(Job):
         self.fphi = fphi
 
     def _setup(self) -> None:
-        write_mtz(self._path("hklin.mtz"), [self.fphi])
+        self._write_mtz("hklin.mtz", [self.fphi])
         self._args += ["--input", "hklin.mtz"]
         self._args += ["--amplitude", self.fphi.label(0)]
         self._args += ["--phase", self.fphi.label(1)]
@@ -65,17 +64,17 @@ class NucleoFindBuild(Job):
         types = [PolymerType.RNA, PolymerType.DNA]
         self.contents.write_sequence_file(self._path("seqin.seq"), types)
         self._args += ["--seqin", "seqin.seq"]
-        write_mtz(self._path("hklin.mtz"), [self.fphi])
+        self._write_mtz("hklin.mtz", [self.fphi])
         self._args += ["--mtzin", "hklin.mtz"]
         self._args += ["--colin-fc", self.fphi.label()]
-        self.prediction.phosphate.write_ccp4_map(self._path("phosin.map"))
-        self.prediction.sugar.write_ccp4_map(self._path("sugarin.map"))
-        self.prediction.base.write_ccp4_map(self._path("basein.map"))
+        self._write_map("phosin.map", self.prediction.phosphate)
+        self._write_map("sugarin.map", self.prediction.sugar)
+        self._write_map("basein.map", self.prediction.base)
         self._args += ["--phosin", "phosin.map"]
         self._args += ["--sugarin", "sugarin.map"]
         self._args += ["--basein", "basein.map"]
         if self.structure is not None:
-            write_mmcif(self._path("xyzin.cif"), self.structure)
+            self._write_mmcif("xyzin.cif", self.structure)
             self._args += ["--pdbin", "xyzin.cif"]
         self._args += ["--cycles", "3"]
         self._args += ["--pdbout", "xyzout.cif"]
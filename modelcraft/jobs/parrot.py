@@ -5,9 +5,8 @@ import gemmi
 from ..contents import AsuContents
 from ..job import Job
 from ..monlib import MonLib
-from ..reflections import DataItem, write_mtz
+from ..reflections import DataItem
 from ..solvent import solvent_fraction
-from ..structure import write_mmcif
 
 
 @dataclasses.dataclass
@@ -27,6 +26,7 @@ class Parrot(Job):
         fphi: DataItem = None,
         structure: gemmi.Structure = None,
         monlib: MonLib = None,
+        solvent_content: float = None,
     ):
         super().__init__("cparrot")
         self.contents = contents
@@ -36,6 +36,7 @@ class Parrot(Job):
         self.monlib = monlib
         self.fphi = fphi
         self.structure = structure
+        self.solvent_content = solvent_content
 
     def _setup(self) -> None:
         self._args += ["-mtzin", "hklin.mtz"]
@@ -46,21 +47,23 @@ class Parrot(Job):
         self._args += [phases_arg, phases_label]
         if self.fphi is not None:
             self._args += ["-colin-fc", "FC,PHIC"]
-        write_mtz(
-            path=self._path("hklin.mtz"),
+        self._write_mtz(
+            "hklin.mtz",
             items=[self.fsigf, self.freer, self.phases, self.fphi],
             labels=["F,SIGF", "FREE", phases_label, "FC,PHIC"],
         )
         if self.structure is not None:
-            write_mmcif(self._path("xyzin.cif"), self.structure)
+            self._write_mmcif("xyzin.cif", self.structure)
             self._args += ["-pdbin-mr", "xyzin.cif"]
-        solvent_content = solvent_fraction(
-            contents=self.contents,
-            cell=self.fsigf.cell,
-            spacegroup=self.fsigf.spacegroup,
-            resolution=self.fsigf.resolution_high(),
-            monlib=self.monlib,
-        )
+        solvent_content = self.solvent_content
+        if solvent_content is None:
+            solvent_content = solvent_fraction(
+                contents=self.contents,
+                cell=self.fsigf.cell,
+                spacegroup=self.fsigf.spacegroup,
+                resolution=self.fsigf.resolution_high(),
+                monlib=self.monlib,
+            )
         self._args += ["-solvent-content", f"{solvent_content:.3f}"]
         self._args += ["-cycles", "5"]
         self._args += ["-anisotropy-correction"]
@@ -1,7 +1,7 @@
 import dataclasses
 
 from ..job import Job
-from ..reflections import DataItem, write_mtz
+from ..reflections import DataItem
 
 
 @dataclasses.dataclass
@@ -27,8 +27,8 @@ class PhaseMatch(Job):
         self._args += [arg1, label1]
         self._args += [arg2, label2]
         self._args += ["-mtzout", "hklout.mtz"]
-        write_mtz(
-            path=self._path("hklin.mtz"),
+        self._write_mtz(
+            "hklin.mtz",
             items=[self.fsigf, self.phases1, self.phases2],
             labels=["F,SIGF", label1, label2],
         )
@@ -1,14 +1,20 @@
 import dataclasses
+import functools
+import os
+import re
 import shutil
 import xml.etree.ElementTree as ET
+from typing import List
 
 import gemmi
 
 from ..job import Job
-from ..reflections import DataItem, write_mtz
-from ..structure import read_structure, write_mmcif
+from ..lazy import Lazy, lazy_fields
+from ..reflections import DataItem
+from ..structure import read_structure
 
 
+@lazy_fields("structure", "mtz", "abcd", "fphi_best", "fphi_diff", "fphi_calc")
 @dataclasses.dataclass
 class RefmacResult:
     structure: gemmi.Structure
@@ -25,9 +31,14 @@ class RefmacResult:
     initial_fsc: float
     data_completeness: float
     resolution_high: float
+    cycles: int
+    rfrees: List[float]
     seconds: float
 
 
+_R_FACTOR = re.compile(r"^\s*(Overall|Free) R factor\s*=\s*(\d+\.\d+)")
+
+
 class Refmac(Job):
     def __init__(
         self,
@@ -39,6 +50,8 @@ class Refmac(Job):
         twinned: bool = False,
         jelly_body: bool = False,
         libin: str = None,
+        convergence_tolerance: float = None,
+        convergence_cycles: int = 2,
     ):
         super().__init__("refmacat")
         self.structure = structure
@@ -49,10 +62,14 @@ class Refmac(Job):
         self.twinned = twinned
         self.jelly_body = jelly_body
         self.libin = libin
+        self.convergence_tolerance = convergence_tolerance
+        self.convergence_cycles = convergence_cycles
+        self._rwork = None
+        self._rfrees = []
 
     def _setup(self) -> None:
-        write_mmcif(self._path("xyzin.cif"), self.structure)
-        write_mtz(self._path("hklin.mtz"), [self.fsigf, self.freer, self.phases])
+        self._write_mmcif("xyzin.cif", self.structure)
+        self._write_mtz("hklin.mtz", [self.fsigf, self.freer, self.phases])
         self._args += ["HKLIN", "./hklin.mtz"]
         self._args += ["XYZIN", "./xyzin.cif"]
         if self.libin:
@@ -85,22 +102,52 @@ class Refmac(Job):
         self._stdin.append("PHOUT")
         self._stdin.append("PNAME modelcraft")
         self._stdin.append("DNAME modelcraft")
+        if self.convergence_tolerance is not None:
+            self._stdin.append("KILL kill.txt")
         self._stdin.append("END")
 
+    def _watch_stdout(self, line: str) -> None:
+        match = _R_FACTOR.match(line)
+        if match is None:
+            return
+        if match.group(1) == "Overall":
+            self._rwork = float(match.group(2))
+            return
+        self._rfrees.append(float(match.group(2)))
+        cycle = len(self._rfrees) - 1
+        if self._rwork is not None:
+            message = f"Cycle {cycle:2d}  R-work {self._rwork:.4f}"
+            print(f"{message}  R-free {self._rfrees[-1]:.4f}", flush=True)
+        if self._converged() and not os.path.exists(self._path("kill.txt")):
+            print(f"Stopping after cycle {cycle} (R-free converged)", flush=True)
+            with open(self._path("kill.txt"), "w", encoding="utf-8"):
+                pass
+
+    def _converged(self) -> bool:
+        if self.convergence_tolerance is None:
+            return False
+        if len(self._rfrees) <= self.convergence_cycles:
+            return False
+        recent = self._rfrees[-self.convergence_cycles - 1 :]
+        changes = [abs(b - a) for a, b in zip(recent, recent[1:])]
+        return all(change < self.convergence_tolerance for change in changes)
+
     def _result(self) -> RefmacResult:
         self._check_files_exist("xyzout.cif", "hklout.mtz", "xmlout.xml")
-        mtz = gemmi.read_mtz_file(self._path("hklout.mtz"))
+        read_mtz = functools.lru_cache(maxsize=None)(
+            functools.partial(gemmi.read_mtz_file, self._path("hklout.mtz"))
+        )
         xml = ET.parse(self._path("xmlout.xml")).getroot()
         rworks = list(xml.iter("r_factor"))
         rfrees = list(xml.iter("r_free"))
         fscs = list(xml.iter("fscAver"))
         return RefmacResult(
-            structure=read_structure(self._path("xyzout.cif")),
-            mtz=mtz,
-            abcd=DataItem(mtz, "HLACOMB,HLBCOMB,HLCCOMB,HLDCOMB"),
-            fphi_best=DataItem(mtz, "FWT,PHWT"),
-            fphi_diff=DataItem(mtz, "DELFWT,PHDELWT"),
-            fphi_calc=DataItem(mtz, "FC_ALL,PHIC_ALL"),
+            structure=Lazy(functools.partial(read_structure, self._path("xyzout.cif"))),
+            mtz=Lazy(read_mtz),
+            abcd=Lazy(lambda: DataItem(read_mtz(), "HLACOMB,HLBCOMB,HLCCOMB,HLDCOMB")),
+            fphi_best=Lazy(lambda: DataItem(read_mtz(), "FWT,PHWT")),
+            fphi_diff=Lazy(lambda: DataItem(read_mtz(), "DELFWT,PHDELWT")),
+            fphi_calc=Lazy(lambda: DataItem(read_mtz(), "FC_ALL,PHIC_ALL")),
             rwork=float(rworks[-1].text),
             rfree=float(rfrees[-1].text),
             fsc=float(fscs[-1].text),
@@ -109,6 +156,8 @@ class Refmac(Job):
             initial_fsc=float(fscs[0].text),
             data_completeness=float(xml.find("Overall_stats/data_completeness").text),
             resolution_high=float(xml.find("Overall_stats/resolution_high").text),
+            cycles=len(rworks) - 1,
+            rfrees=[float(rfree.text) for rfree in rfrees],
             seconds=self._seconds,
         )
 
@@ -127,7 +176,7 @@ class RefmacMapToMtz(Job):
         self.blur = blur
 
     def _setup(self) -> None:
-        self.density.write_ccp4_map(self._path("mapin.ccp4"))
+        self._write_map("mapin.ccp4", self.density)
         self._args += ["MAPIN", "mapin.ccp4"]
         self._args += ["HKLOUT", "hklout.mtz"]
         self._stdin.append("MODE SFCALC")
@@ -5,8 +5,8 @@ import gemmi
 
 from ..job import Job
 from ..maps import read_map
-from ..reflections import DataItem, write_mtz
-from ..structure import read_structure, write_mmcif
+from ..reflections import DataItem
+from ..structure import read_structure
 
 
 @dataclasses.dataclass
@@ -23,7 +23,7 @@ class ServalcatFw(Job):
         self.observations = observations
 
     def _setup(self) -> None:
-        write_mtz(self._path("hklin.mtz"), [self.observations])
+        self._write_mtz("hklin.mtz", [self.observations])
         self._args += ["fw", "--hklin", "hklin.mtz", "-o", "output"]
 
     def _result(self) -> ServalcatFwResult:
@@ -62,13 +62,13 @@ class ServalcatNemap(Job):
         self.resolution = resolution
 
     def _setup(self) -> None:
-        self.halfmap1.write_ccp4_map(self._path("halfmap1.ccp4"))
-        self.halfmap2.write_ccp4_map(self._path("halfmap2.ccp4"))
+        self._write_map("halfmap1.ccp4", self.halfmap1)
+        self._write_map("halfmap2.ccp4", self.halfmap2)
         self._args += ["util", "nemap"]
         self._args += ["--halfmaps", "halfmap1.ccp4", "halfmap2.ccp4"]
         self._args += ["--resolution", str(self.resolution)]
         if self.mask is not None:
-            self.mask.write_ccp4_map(self._path("mask.ccp4"))
+            self._write_map("mask.ccp4", self.mask)
             self._args += ["--mask", "mask.ccp4"]
 
     def _result(self) -> ServalcatNemapResult:
@@ -95,11 +95,11 @@ class ServalcatTrim(Job):
 
     def _setup(self) -> None:
         self._args += ["trim"]
-        self.mask.write_ccp4_map(self._path("mask.ccp4"))
+        self._write_map("mask.ccp4", self.mask)
         self._args += ["--mask", "mask.ccp4"]
         self._args.append("--maps")
         for name, ccp4_map in self.maps.items():
-            ccp4_map.write_ccp4_map(self._path(f"{name}.ccp4"))
+            self._write_map(f"{name}.ccp4", ccp4_map)
             self._args.append(f"{name}.ccp4")
         self._args.append("--noncubic")
         self._args.append("--noncentered")
@@ -154,14 +154,14 @@ class ServalcatRefine(Job):
 
     def _setup(self) -> None:
         self._args += ["refine_spa"]
-        write_mmcif(self._path("structure.cif"), self.structure)
+        self._write_mmcif("structure.cif", self.structure)
         self._args += ["--model", "structure.cif"]
         if self.halfmap1 is not None and self.halfmap2 is not None:
-            self.halfmap1.write_ccp4_map(self._path("halfmap1.ccp4"))
-            self.halfmap2.write_ccp4_map(self._path("halfmap2.ccp4"))
+            self._write_map("halfmap1.ccp4", self.halfmap1)
+            self._write_map("halfmap2.ccp4", self.halfmap2)
             self._args += ["--halfmaps", "halfmap1.ccp4", "halfmap2.ccp4"]
         else:
-            self.density.write_ccp4_map(self._path("density.ccp4"))
+            self._write_map("density.ccp4", self.density)
             self._args += ["--map", "density.ccp4"]
         self._args += ["--resolution", str(self.resolution)]
         self._args += ["--blur", str(self.blur)]
@@ -210,14 +210,14 @@ class ServalcatFsc(Job):
 
     def _setup(self) -> None:
         self._args += ["fsc"]
-        write_mmcif(self._path("structure.cif"), self.structure)
+        self._write_mmcif("structure.cif", self.structure)
         self._args += ["--model", "structure.cif"]
         if self.halfmap1 is not None and self.halfmap2 is not None:
-            self.halfmap1.write_ccp4_map(self._path("halfmap1.ccp4"))
-            self.halfmap2.write_ccp4_map(self._path("halfmap2.ccp4"))
+            self._write_map("halfmap1.ccp4", self.halfmap1)
+            self._write_map("halfmap2.ccp4", self.halfmap2)
             self._args += ["--halfmaps", "halfmap1.ccp4", "halfmap2.ccp4"]
         else:
-            self.density.write_ccp4_map(self._path("density.ccp4"))
+            self._write_map("density.ccp4", self.density)
             self._args += ["--map", "density.ccp4"]
         self._args += ["--resolution", str(self.resolution)]
 
@@ -1,12 +1,15 @@
 import dataclasses
+import functools
 
 import gemmi
 
 from ..job import Job
-from ..reflections import DataItem, write_mtz
-from ..structure import read_structure, write_mmcif
+from ..lazy import Lazy, lazy_fields
+from ..reflections import DataItem
+from ..structure import read_structure
 
 
+@lazy_fields("structure")
 @dataclasses.dataclass
 class SheetbendResult:
     structure: gemmi.Structure
@@ -28,8 +31,8 @@ class Sheetbend(Job):
         self.regularise = regularise
 
     def _setup(self) -> None:
-        write_mmcif(self._path("xyzin.cif"), self.structure)
-        write_mtz(self._path("hklin.mtz"), [self.fsigf, self.freer])
+        self._write_mmcif("xyzin.cif", self.structure)
+        self._write_mtz("hklin.mtz", [self.fsigf, self.freer])
         self._args += ["-mtzin", "hklin.mtz"]
         self._args += ["-colin-fo", self.fsigf.label()]
         if self.freer is not None:
@@ -46,6 +49,6 @@ class Sheetbend(Job):
     def _result(self) -> SheetbendResult:
         self._check_files_exist("xyzout.cif")
         return SheetbendResult(
-            structure=read_structure(self._path("xyzout.cif")),
+            structure=Lazy(functools.partial(read_structure, self._path("xyzout.cif"))),
             seconds=self._seconds,
         )
@@ -0,0 +1,95 @@
+import threading
+import weakref
+from typing import Callable, Optional
+
+_LOCK = threading.Lock()
+_FILES = "_lazy_files"
+
+
+class Lazy:
+    "Placeholder for a result field that is read from a job output file when used"
+
+    def __init__(self, load: Callable[[], object]):
+        self.load = load
+
+
+class _LazyField:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.name]
+        if not isinstance(value, Lazy):
+            return value
+        loaded = value.load()
+        files = None
+        with _LOCK:
+            value = instance.__dict__[self.name]
+            if isinstance(value, Lazy):
+                value = instance.__dict__[self.name] = loaded
+                if not _has_lazy_values(instance):
+                    files = instance.__dict__.pop(_FILES, None)
+        if files is not None:
+            files()
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+
+
+def lazy_fields(*names: str):
+    "Class decorator (applied after dataclass) for fields that can be given as Lazy"
+
+    def decorator(cls):
+        for name in names:
+            setattr(cls, name, _LazyField(name))
+        return cls
+
+    return decorator
+
+
+def is_lazy_field(result, name: str) -> bool:
+    return isinstance(getattr(type(result), name, None), _LazyField)
+
+
+def is_loaded(result, name: str) -> bool:
+    return not isinstance(vars(result).get(name), Lazy)
+
+
+def all_loaded(result) -> bool:
+    return not _has_lazy_values(result)
+
+
+def peek(result, name: str):
+    "The value of a field, read without keeping it if it is lazy"
+    value = vars(result).get(name)
+    if isinstance(value, Lazy):
+        return value.load()
+    return getattr(result, name)
+
+
+def load_all(result) -> None:
+    "Load all lazy fields so that the job files are no longer needed"
+    for name, value in list(vars(result).items()):
+        if isinstance(value, Lazy):
+            getattr(result, name)
+
+
+def keep_files(result, cleanup: Callable[[], None]) -> Optional[weakref.finalize]:
+    """
+    Call cleanup (to remove the job files) once the lazy fields have been loaded
+    or the result has been garbage collected.
+    Returns the finalizer, or None if cleanup was called straight away.
+    """
+    if not _has_lazy_values(result):
+        cleanup()
+        return None
+    files = weakref.finalize(result, cleanup)
+    result.__dict__[_FILES] = files
+    return files
+
+
+def _has_lazy_values(result) -> bool:
+    return any(isinstance(value, Lazy) for value in vars(result).values())
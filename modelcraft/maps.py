@@ -1,4 +1,7 @@
+from typing import List
+
 import gemmi
+import numpy
 
 
 def read_map(path: str) -> gemmi.Ccp4Map:
@@ -8,3 +11,32 @@ def read_map(path: str) -> gemmi.Ccp4Map:
     for word_number in (50, 51, 52):
         ccp4.set_header_float(word_number, 0.0)
     return ccp4
+
+
+def skewness(grid: gemmi.FloatGrid, mask: numpy.ndarray = None) -> float:
+    "Skewness of the map values (inside the mask if given)"
+    values = numpy.array(grid, copy=False)
+    if mask is not None:
+        values = values[mask]
+    deviations = values - values.mean()
+    variance = numpy.mean(deviations**2)
+    if variance == 0:
+        return 0.0
+    return float(numpy.mean(deviations**3) / variance**1.5)
+
+
+def protein_skewness(grids: List[gemmi.FloatGrid], solvents: List[float]) -> list:
+    """
+    Skewness of density-modified maps inside the region that is protein in all
+    of them, taking the protein in each map as the highest values by volume.
+    Flattened solvent is left out so that the values can be compared between maps
+    modified with different solvent contents.
+    """
+    arrays = [numpy.array(grid, copy=False) for grid in grids]
+    mask = numpy.logical_and.reduce(
+        [
+            array > numpy.quantile(array, solvent)
+            for array, solvent in zip(arrays, solvents)
+        ]
+    )
+    return [skewness(grid, mask) for grid in grids]
@@ -0,0 +1,121 @@
+import collections
+import os
+import time
+
+from .utils import puid
+
+
+class MetricsFile:
+    "Prometheus text file for the node exporter textfile collector"
+
+    def __init__(self, path: str, labels: dict):
+        self.path = path
+        self.labels = labels
+        self.cycle = 0
+        self.failures = collections.Counter()
+        self.start_time = time.time()
+        self.finished = 0
+
+    def update(self, event: str, fields: dict, pipeline) -> None:
+        "Record the event and rewrite the file (called with the pipeline locked)"
+        if event == "cycle_start":
+            self.cycle = fields["cycle"]
+        elif event == "job_failure":
+            self.failures[fields["name"]] += 1
+        elif event == "termination":
+            self.finished = 1
+        self._write(pipeline)
+
+    def _write(self, pipeline) -> None:
+        running = collections.Counter(pipeline.running_jobs)
+        jobs = collections.Counter(job["name"] for job in pipeline.report["jobs"])
+        cycles = pipeline.report.get("cycles", [])
+        r_frees = [cycle["r_free"] for cycle in cycles if "r_free" in cycle]
+        fscs = [cycle["fsc"] for cycle in cycles if "fsc" in cycle]
+        peak_rss = max(
+            (totals.get("max_rss_kb", 0) for totals in pipeline.resources.values()),
+            default=0,
+        )
+        lines = []
+        self._add(lines, "cycle", "gauge", "Current cycle", [({}, self.cycle)])
+        self._add(
+            lines,
+            "running_jobs",
+            "gauge",
+            "Programs currently running",
+            [({"executable": name}, count) for name, count in running.items()]
+            or [({}, 0)],
+        )
+        self._add(
+            lines,
+            "executable_seconds_total",
+            "counter",
+            "Wall time spent running each executable",
+            [
+                ({"executable": os.path.basename(path)}, seconds)
+                for path, seconds in pipeline.seconds.items()
+                if path != "total"
+            ],
+        )
+        self._add(
+            lines,
+            "jobs_total",
+            "counter",
+            "Finished jobs per executable",
+            [({"executable": name}, count) for name, count in jobs.items()],
+        )
+        self._add(
+            lines,
+            "job_failures_total",
+            "counter",
+            "Failed jobs per executable",
+            [({"executable": name}, count) for name, count in self.failures.items()],
+        )
+        if r_frees:
+            self._add(
+                lines, "best_r_free", "gauge", "Best R-free", [({}, min(r_frees))]
+            )
+        if fscs:
+            self._add(lines, "best_fsc", "gauge", "Best FSC", [({}, max(fscs))])
+        self._add(
+            lines,
+            "peak_child_rss_bytes",
+            "gauge",
+            "Peak resident set size of any program",
+            [({}, peak_rss * 1024)],
+        )
+        self._add(
+            lines, "start_time_seconds", "gauge", "Start time", [({}, self.start_time)]
+        )
+        self._add(
+            lines,
+            "last_update_seconds",
+            "gauge",
+            "Time of the last event",
+            [({}, time.time())],
+        )
+        self._add(
+            lines,
+            "finished",
+            "gauge",
+            "Whether the run has ended",
+            [({}, self.finished)],
+        )
+        temp = f"{self.path}.tmp_{puid()}"
+        with open(temp, "w", encoding="utf-8") as stream:
+            stream.write("\n".join(lines) + "\n")
+        os.replace(temp, self.path)
+
+    def _add(self, lines: list, name: str, type_: str, help_: str, samples) -> None:
+        name = f"modelcraft_{name}"
+        lines.append(f"# HELP {name} {help_}")
+        lines.append(f"# TYPE {name} {type_}")
+        for extra, value in samples:
+            labels = {**self.labels, **extra}
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+
+
+def _escape(value) -> str:
+    text = str(value)
+    return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -4,6 +4,9 @@ import time
 import gemmi
 
 from . import __version__
+from .budget import TimeBudget
+from .cache import job_cache
+from .executor import job_executor
 from .jobs.buccaneer import Buccaneer
 from .jobs.emda import EmdaMapMask
 from .jobs.nautilus import Nautilus
@@ -13,17 +16,31 @@ from .jobs.servalcat import ServalcatFsc, ServalcatNemap, ServalcatRefine, Serva
 from .maps import read_map
 from .pipeline import Pipeline
 from .reflections import convert_to_fsigf_and_phifom
+from .stages import StageGraph
 from .structure import ModelStats, write_mmcif
+from .trace import span, traced
+from .utils import minutes_to_seconds
+
+_SETUP_ATTRIBUTES = ("maps", "fmean", "phases", "fphi", "nucleofind_prediction")
 
 
 class ModelCraftEm(Pipeline):
-    def __init__(self, parsed_args, raw_args):
+    def __init__(self, parsed_args, raw_args, job_slots=None):
         self.args = parsed_args
         super().__init__(
             directory=self.args.directory,
             keep_jobs=self.args.keep_files,
             keep_logs=self.args.keep_logs,
             json_name="modelcraft.json",
+            parallel_jobs=self.args.parallel_jobs,
+            cache=job_cache(self.args),
+            scratch_directory=self.args.scratch_dir,
+            job_timeout=minutes_to_seconds(self.args.job_timeout),
+            idle_timeout=minutes_to_seconds(self.args.job_idle_timeout),
+            executor=job_executor(self.args),
+            trace=self.args.trace,
+            metrics_path=self.args.metrics_file,
+            job_slots=job_slots,
         )
         self.report["version"] = __version__
         self.report["args"] = raw_args
@@ -33,55 +50,142 @@ class ModelCraftEm(Pipeline):
         self.phases = None
         self.fphi = None
         self.nucleofind_prediction = None
+        self.time_budget = None
+        if self.args.time_budget is not None:
+            self.time_budget = TimeBudget(minutes_to_seconds(self.args.time_budget))
 
     def run(self):
         print(f"# ModelCraft {__version__}", flush=True)
-        os.makedirs(self.args.directory, exist_ok=self.args.overwrite_directory)
+        exist_ok = self.args.overwrite_directory or self.args.resume
+        os.makedirs(self.args.directory, exist_ok=exist_ok)
         self.start_time = time.time()
+        self.check_executables(self._executables())
+        build_nucleic = self.args.contents.rnas or self.args.contents.dnas
+        original_map_centre = self._prepare_maps(build_nucleic)
+        cycle, structure, best_fsc, cycles_without_improvement = self._cycle_state()
+        stopped = cycles_without_improvement == self.args.auto_stop_cycles > 0
+        while cycle < self.args.cycles and not stopped:
+            graph = self._cycle_stages(structure, build_nucleic)
+            if not self._fits_time_budget(graph, cycle + 1):
+                break
+            cycle += 1
+            print(f"\n## Cycle {cycle}\n", flush=True)
+            self.log_event("cycle_start", cycle=cycle)
+            with span(f"Cycle {cycle}", "cycle"):
+                results = graph.run(budget=self.args.parallel_jobs)
+                if self.time_budget is not None:
+                    self.time_budget.record(graph)
+                structure, fsc = results["structure"], results["fsc"]
+                model_stats = ModelStats(structure)
+                stats = {"cycle": cycle, "residues": model_stats.residues, "fsc": fsc}
+                self.report["cycles"].append(stats)
+                if best_fsc is None or fsc > best_fsc:
+                    best_fsc = fsc
+                    cycles_without_improvement = 0
+                    self.shift(structure, original_map_centre)
+                    write_mmcif(self.path("modelcraft.cif"), structure)
+                    self.report["final"] = stats
+                else:
+                    cycles_without_improvement += 1
+                self.log_event("cycle", **stats)
+                self.write_report()
+                state = {
+                    "cycle": cycle,
+                    "structure": structure,
+                    "best_fsc": best_fsc,
+                    "cycles_without_improvement": cycles_without_improvement,
+                }
+                self.save_checkpoint("cycle", state)
+            stopped = cycles_without_improvement == self.args.auto_stop_cycles > 0
+        self.checkpoint.remove()
+        self.terminate("Normal")
+
+    def _prepare_maps(self, build_nucleic: bool) -> gemmi.Position:
+        "Set up the maps, resuming from the checkpoint if possible"
+        setup = self.load_checkpoint("setup") if self.args.resume else None
+        if setup is not None:
+            for name in _SETUP_ATTRIBUTES:
+                setattr(self, name, setup[name])
+            return gemmi.Position(*setup["original_map_centre"])
         self._read_input_maps()
         original_map_centre = self.map_centre()
         self._trim_input_maps()
         self._calculate_fmean_and_phases()
-        structure = self.args.model
-        best_fsc = None
-        cycles_without_improvement = 0
-        build_nucleic = self.args.contents.rnas or self.args.contents.dnas
         if build_nucleic:
-            try:
-                self.nucleofind_prediction = NucleoFindPredict(self.fphi).run(self)
-                if self.args.output_nucleofind_maps:
-                    for key in ["phosphate", "sugar", "base"]:
-                        ccp4_map = getattr(self.nucleofind_prediction, key)
-                        ccp4_map.write_ccp4_map(self.path(f"predicted-{key}.map"))
-            except FileNotFoundError:
-                print("Warning: nucleofind prediction failed", flush=True)
-        for cycle in range(1, self.args.cycles + 1):
-            print(f"\n## Cycle {cycle}\n", flush=True)
-            if self.args.contents.proteins:
-                structure = self.buccaneer(structure)
-                structure = self.servalcat_refine(structure)
-            if build_nucleic:
-                if self.nucleofind_prediction is None:
-                    structure = self.nautilus(structure)
-                else:
-                    structure = self.nucleofind(structure)
-                structure = self.servalcat_refine(structure)
-            model_stats = ModelStats(structure)
-            fsc = self.servalcat_fsc(structure)
-            stats = {"cycle": cycle, "residues": model_stats.residues, "fsc": fsc}
-            self.report["cycles"].append(stats)
-            if best_fsc is None or fsc > best_fsc:
-                best_fsc = fsc
-                cycles_without_improvement = 0
-                self.shift(structure, original_map_centre)
-                write_mmcif(self.path("modelcraft.cif"), structure)
-                self.report["final"] = stats
+            self._predict_nucleic()
+        setup = {name: getattr(self, name) for name in _SETUP_ATTRIBUTES}
+        setup["original_map_centre"] = original_map_centre.tolist()
+        self.save_checkpoint("setup", setup)
+        return original_map_centre
+
+    def _cycle_state(self) -> tuple:
+        "Cycle, structure, best FSC and cycles without improvement to start from"
+        state = self.load_checkpoint("cycle") if self.args.resume else None
+        if state is None:
+            return 0, self.args.model, None, 0
+        print(f"Resuming after cycle {state['cycle']}", flush=True)
+        return (
+            state["cycle"],
+            state["structure"],
+            state["best_fsc"],
+            state["cycles_without_improvement"],
+        )
+
+    def _fits_time_budget(self, graph: StageGraph, cycle: int) -> bool:
+        budget = self.time_budget
+        if budget is None or budget.allows(budget.predict(graph)):
+            return True
+        print(f"\nStopping before cycle {cycle} to fit the time budget", flush=True)
+        self.log_event("time_budget", cycle=cycle, action="stop")
+        return False
+
+    def _cycle_stages(self, structure: gemmi.Structure, build_nucleic) -> StageGraph:
+        "Each stage takes the structure from the previous one"
+        graph = StageGraph()
+        graph.results["input"] = structure
+        previous = "input"
+
+        def add(name, function):
+            nonlocal previous
+            source = previous
+            graph.add(name, lambda: function(graph.results[source]), (source,))
+            previous = name
+
+        if self.args.contents.proteins:
+            add("buccaneer", self.buccaneer)
+            add("refine_protein", self.servalcat_refine)
+        if build_nucleic:
+            if self.nucleofind_prediction is None:
+                add("nautilus", self.nautilus)
             else:
-                cycles_without_improvement += 1
-            self.write_report()
-            if cycles_without_improvement == self.args.auto_stop_cycles > 0:
-                break
-        self.terminate("Normal")
+                add("nucleofind", self.nucleofind)
+            add("refine_nucleic", self.servalcat_refine)
+        source = previous
+        graph.add("fsc", lambda: self.servalcat_fsc(graph.results[source]), (source,))
+        graph.add("structure", lambda: graph.results[source], (source,))
+        return graph
+
+    @traced("stage")
+    def _predict_nucleic(self):
+        try:
+            self.nucleofind_prediction = NucleoFindPredict(self.fphi).run(self)
+            if self.args.output_nucleofind_maps:
+                for key in ["phosphate", "sugar", "base"]:
+                    ccp4_map = getattr(self.nucleofind_prediction, key)
+                    ccp4_map.write_ccp4_map(self.path(f"predicted-{key}.map"))
+        except FileNotFoundError:
+            print("Warning: nucleofind prediction failed", flush=True)
+
+    def _executables(self) -> list:
+        "Programs that could be run with the given arguments"
+        names = ["servalcat", "refmacat"]
+        if self.args.mask == "auto":
+            names.append("emda")
+        if self.args.contents.proteins:
+            names.append("cbuccaneer")
+        if self.args.contents.rnas or self.args.contents.dnas:
+            names += ["nucleofind", "nucleofind-build", "cnautilus"]
+        return names
 
     def _read_input_maps(self):
         if self.args.half_maps:
@@ -92,6 +196,7 @@ class ModelCraftEm(Pipeline):
         if self.args.build_map:
             self.maps["build_map"] = read_map(self.args.build_map)
 
+    @traced("stage")
     def _trim_input_maps(self):
         if self.args.mask:
             if self.args.mask == "auto":
@@ -102,6 +207,7 @@ class ModelCraftEm(Pipeline):
             trimmed = ServalcatTrim(mask, self.maps).run(self)
             self.maps.update(trimmed.maps)
 
+    @traced("stage")
     def _calculate_fmean_and_phases(self):
         if self.args.build_map:
             refmac = RefmacMapToMtz(
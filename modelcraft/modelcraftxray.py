@@ -1,13 +1,18 @@
+import functools
 import os
 import time
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from typing import List
 
 import gemmi
 
 from . import __version__
+from .budget import TimeBudget, mean_job_seconds
+from .cache import job_cache
 from .cell import max_distortion, remove_scale, update_cell
 from .combine import combine_results
+from .executor import job_executor
 from .jobs.buccaneer import Buccaneer
 from .jobs.ctruncate import CTruncate
 from .jobs.findwaters import FindWaters
@@ -16,23 +21,60 @@ from .jobs.nucleofind import NucleoFindBuild, NucleoFindPredict
 from .jobs.parrot import Parrot
 from .jobs.refmac import Refmac
 from .jobs.sheetbend import Sheetbend
-from .monlib import MonLib
+from .lazy import load_all
+from .maps import protein_skewness
+from .monlib import MonLib, MonLibCache
 from .pipeline import Pipeline
 from .prune import prune
-from .reflections import DataItem, write_mtz
+from .refinement import AdaptiveCycles, ResolutionRamp
+from .reflections import DataItem, truncate_resolution, write_mtz
 from .scripts.sidechains import any_missing_side_chains
 from .scripts.sidechains import main as fix_side_chains
+from .solvent import copies_options
+from .stages import StageGraph, StageUtility
 from .structure import ModelStats, remove_residues, write_mmcif
+from .trace import span, traced
+from .utils import gigabytes_to_bytes, minutes_to_seconds
+
+_CHECKPOINT_ATTRIBUTES = (
+    "cycle",
+    "current_structure",
+    "current_phases",
+    "current_fphi_best",
+    "current_fphi_diff",
+    "current_fphi_calc",
+    "last_refmac",
+    "output_refmac",
+    "cycles_without_improvement",
+    "resolution_ramp",
+    "parrot_solvent",
+)
+_CHECKPOINT_ARGS = ("fmean", "fanom", "imean", "model", "phases")
+_MODEL = ("structure", "phases")
+# Resolution limit (A) for the --build-trials run that builds into low-resolution data
+_TRIAL_RESOLUTION = 2.5
 
 
 class ModelCraftXray(Pipeline):
-    def __init__(self, parsed_args, raw_args):
+    def __init__(
+        self, parsed_args, raw_args, job_slots=None, monlibs: MonLibCache = None
+    ):
         self.args = parsed_args
         super().__init__(
             directory=self.args.directory,
             keep_jobs=self.args.keep_files,
             keep_logs=self.args.keep_logs,
             json_name="modelcraft.json",
+            parallel_jobs=self.args.parallel_jobs,
+            cache=job_cache(self.args),
+            scratch_directory=self.args.scratch_dir,
+            job_timeout=minutes_to_seconds(self.args.job_timeout),
+            idle_timeout=minutes_to_seconds(self.args.job_idle_timeout),
+            executor=job_executor(self.args),
+            trace=self.args.trace,
+            metrics_path=self.args.metrics_file,
+            job_slots=job_slots,
+            result_memory=gigabytes_to_bytes(self.args.result_memory),
         )
         self.report["version"] = __version__
         self.report["args"] = raw_args
@@ -46,33 +88,103 @@ class ModelCraftXray(Pipeline):
         self.last_refmac = None
         self.output_refmac = None
         self.cycles_without_improvement = 0
+        self.time_budget = None
+        if self.args.time_budget is not None:
+            self.time_budget = TimeBudget(minutes_to_seconds(self.args.time_budget))
+        self.stage_utility = None
+        if self.args.min_stage_gain is not None:
+            self.stage_utility = StageUtility(self.args.min_stage_gain)
+            self.report["stage_utility"] = self.stage_utility.history
+        if self.args.build_trials > 1:
+            self.report["build_trials"] = []
+        self.parrot_solvent = None
+        self._parrot_candidates = None
+        self.resolution_ramp = None
+        self._truncated = None
+        if self.args.resolution_ramp is not None:
+            self.report["resolution_ramp"] = []
+        self.refmac_cycles = None
+        if self.args.adaptive_refmac_cycles is not None:
+            minimum, maximum = self.args.adaptive_refmac_cycles
+            tolerance = self.args.refmac_tolerance or 0.001
+            self.refmac_cycles = AdaptiveCycles(minimum, maximum, tolerance)
+            self.report["refmac_cycles"] = []
         resnames = self.args.contents.monomer_codes()
         if self.args.model:
             resnames |= set(self.args.model[0].get_all_residue_names())
-        self.monlib = MonLib(resnames, self.args.restraints, include_standard=True)
+        if monlibs is None:
+            self.monlib = MonLib(resnames, self.args.restraints, include_standard=True)
+        else:
+            self.monlib = monlibs.get(
+                resnames, self.args.restraints, include_standard=True
+            )
 
     @property
     def resolution(self):
         return self.args.fmean.resolution_high()
 
+    @property
+    def fmean(self) -> DataItem:
+        "Mean amplitudes to the current resolution limit"
+        return self._working_data()[0]
+
+    @property
+    def freer(self) -> DataItem:
+        "Free-R flags to the current resolution limit"
+        return self._working_data()[1]
+
+    def _working_data(self) -> tuple:
+        ramp = self.resolution_ramp
+        if ramp is None or ramp.finished:
+            return self.args.fmean, self.args.freer
+        with self.lock:
+            if self._truncated is None or self._truncated[0] != ramp.limit:
+                fmean = truncate_resolution(self.args.fmean, ramp.limit)
+                freer = truncate_resolution(self.args.freer, ramp.limit)
+                self._truncated = (ramp.limit, fmean, freer)
+            return self._truncated[1:]
+
     def run(self):
         print(f"# ModelCraft {__version__}", flush=True)
-        os.makedirs(self.args.directory, exist_ok=self.args.overwrite_directory)
+        exist_ok = self.args.overwrite_directory or self.args.resume
+        os.makedirs(self.args.directory, exist_ok=exist_ok)
         self.start_time = time.time()
-        if self.args.fmean is None:
-            self._convert_observations()
-        if self.args.model is not None:
-            self._refine_input_model()
-        for self.cycle in range(1, self.args.cycles + 1):
+        resumed = self.args.resume and self._resume()
+        self.check_executables(self._executables())
+        if not resumed:
+            if self.args.fmean is None:
+                self._convert_observations()
+            self._start_resolution_ramp()
+            if self.args.model is not None:
+                self._refine_input_model()
+        while self.cycle < self.args.cycles and not self._auto_stopped():
+            graph = self._plan_cycle(self.cycle + 1)
+            if graph is None:
+                break
+            self.cycle += 1
             print(f"\n## Cycle {self.cycle}\n", flush=True)
-            self.run_cycle()
+            self.log_event("cycle_start", cycle=self.cycle)
+            with span(f"Cycle {self.cycle}", "cycle"):
+                self.run_cycle(graph)
+                if self._step_resolution_ramp():
+                    self._extend_resolution(self.last_refmac.structure)
+                self.process_cycle_output(self.last_refmac)
+                self._save_checkpoint()
+        if (
+            self.resolution_ramp is not None
+            and not self.resolution_ramp.finished
+            and self._time_for_full_data()
+        ):
+            print("\n## Refining against the full data\n", flush=True)
+            self.cycle += 1
+            self.resolution_ramp.finish()
+            self._extend_resolution(self.output_refmac.structure)
             self.process_cycle_output(self.last_refmac)
-            if self.cycles_without_improvement == self.args.auto_stop_cycles > 0:
-                break
         if (
             not self.args.basic
             and not self.args.disable_side_chain_fixing
             and any_missing_side_chains(self.output_refmac.structure)
+            and self._time_for_refmac()
         ):
             print("\n## Adding missing side chains\n", flush=True)
             self.cycle += 1
@@ -82,8 +194,89 @@ class ModelCraftXray(Pipeline):
         print("\n## Best Model:", flush=True)
         self._print_refmac_result(self.output_refmac)
         self._remove_current_files()
+        self.checkpoint.remove()
         self.terminate(reason="Normal")
 
+    def _start_resolution_ramp(self):
+        start = self.args.resolution_ramp
+        if start is not None and start > self.resolution:
+            self.resolution_ramp = ResolutionRamp(start, self.resolution)
+            print(f"Starting with data to {start:.2f} A", flush=True)
+
+    def _step_resolution_ramp(self) -> bool:
+        "Step the resolution limit after a cycle and return whether it changed"
+        ramp = self.resolution_ramp
+        if ramp is None or ramp.finished:
+            return False
+        improved = (
+            self.output_refmac is None
+            or self.last_refmac.rwork < self.output_refmac.rwork
+        )
+        return ramp.update(self.last_refmac.rfree, improved)
+
+    def _extend_resolution(self, structure: gemmi.Structure):
+        """
+        Refine against the data to the new resolution limit and restart the search
+        for the best model, as R-factors at different limits cannot be compared
+        """
+        limit = self.resolution_ramp.limit
+        print(f"\nExtending the data to {limit:.2f} A", flush=True)
+        with self.lock:
+            self.report["resolution_ramp"].append({"cycle": self.cycle, "limit": limit})
+        self.log_event("resolution_ramp", cycle=self.cycle, limit=limit)
+        result = self.run_refmac(structure, cycles=10, stage="resolution_ramp")
+        self.update_current_from_refmac_result(result)
+        self.output_refmac = None
+        self.cycles_without_improvement = 0
+
+    def _auto_stopped(self) -> bool:
+        return self.cycles_without_improvement == self.args.auto_stop_cycles > 0
+
+    def _save_checkpoint(self):
+        state = {name: getattr(self, name) for name in _CHECKPOINT_ATTRIBUTES}
+        state["args"] = {name: getattr(self.args, name) for name in _CHECKPOINT_ARGS}
+        self.save_checkpoint("cycle", state)
+
+    def _resume(self) -> bool:
+        "Restore the state from the last completed cycle and return if there was one"
+        state = self.load_checkpoint("cycle")
+        if state is None:
+            print("No checkpoint found so starting from the beginning", flush=True)
+            return False
+        for name in _CHECKPOINT_ATTRIBUTES:
+            setattr(self, name, state[name])
+        for name in _CHECKPOINT_ARGS:
+            setattr(self.args, name, state["args"][name])
+        # The report loaded with the checkpoint replaces the live entries,
+        # so rebuild the adaptive state from it and link the report back up
+        if self.stage_utility is not None:
+            self.stage_utility.replay(self.report["stage_utility"])
+            self.report["stage_utility"] = self.stage_utility.history
+        if self.refmac_cycles is not None:
+            for decision in self.report["refmac_cycles"]:
+                self.refmac_cycles.needed[decision["stage"]].append(decision["needed"])
+        print(f"Resuming after cycle {self.cycle}", flush=True)
+        return True
+
+    def _executables(self) -> list:
+        "Programs that could be run with the given arguments"
+        args = self.args
+        names = ["refmacat"]
+        if args.fmean is None:
+            names.append("ctruncate")
+        if args.model is not None and not args.disable_sheetbend:
+            names.append("csheetbend")
+        if not args.disable_parrot:
+            names.append("cparrot")
+        if not args.basic and not (args.disable_waters and args.disable_dummy_atoms):
+            names.append("findwaters")
+        if args.contents.proteins:
+            names.append("cbuccaneer")
+        if args.contents.rnas or args.contents.dnas:
+            names += ["nucleofind", "nucleofind-build", "cnautilus"]
+        return names
+
+    @traced("stage")
     def _convert_observations(self):
         print("\n## Converting input observations to mean amplitudes\n", flush=True)
         observations = self.args.ianom or self.args.imean or self.args.fanom
@@ -94,89 +287,263 @@ class ModelCraftXray(Pipeline):
         if self.args.imean is None and ctruncate.imean is not None:
             self.args.imean = ctruncate.imean
 
+    @traced("stage")
     def _refine_input_model(self):
         print("\n## Refining Input Model\n", flush=True)
         self.update_model_cell()
         write_mmcif(self.path("current.cif"), self.current_structure)
-        if self.args.disable_sheetbend:
-            self.refmac(self.current_structure, cycles=10, auto_accept=True)
-        else:
-            sheetbend = Sheetbend(
-                fsigf=self.args.fmean,
-                freer=self.args.freer,
-                structure=self.current_structure,
-            ).run(self)
-            result1 = self.run_refmac(sheetbend.structure, cycles=10)
-            result2 = self.run_refmac(self.current_structure, cycles=10)
-            chosen = result1 if result1.rfree < result2.rfree else result2
-            self.update_current_from_refmac_result(chosen)
+        graph = StageGraph()
+        for name, prepare in self._input_model_candidates().items():
+            refine = functools.partial(self._refine_candidate, prepare)
+            graph.add(name, refine, ("model",))
+        results = graph.run(budget=self.args.parallel_jobs)
+        chosen = min(results, key=lambda name: results[name].rfree)
+        if len(results) > 1:
+            print(f"\nUsing the {chosen} input model", flush=True)
+        self.update_current_from_refmac_result(results[chosen])
         self.args.model = self.current_structure
         if self.args.phases is not None:
             self.current_phases = self.args.phases
         self._print_refmac_result(self.last_refmac)
 
-    def run_cycle(self):
+    def _input_model_candidates(self) -> dict:
+        """
+        Functions that make alternative starting models from the input model.
+        Each is refined independently (at the same time if there are parallel jobs)
+        and the one with the lowest R-free is used.
+        """
+        candidates = {}
+        if not self.args.disable_sheetbend:
+            candidates["sheetbend"] = self._sheetbend
+        candidates["unmodified"] = lambda structure: structure
+        return candidates
+
+    def _refine_candidate(self, prepare):
+        structure = prepare(self.current_structure)
+        return self.run_refmac(structure, cycles=10, stage="input_model")
+
+    def _sheetbend(self, structure: gemmi.Structure) -> gemmi.Structure:
+        return (
+            Sheetbend(
+                fsigf=self.fmean,
+                freer=self.freer,
+                structure=structure,
+            )
+            .run(self)
+            .structure
+        )
+
+    def run_cycle(self, graph: StageGraph):
+        graph.run(budget=self.args.parallel_jobs)
+        if self.time_budget is not None:
+            self.time_budget.record(graph)
+
+    def _plan_cycle(self, cycle: int):
+        "Stages for the cycle, shortened or None if they might not fit the time budget"
+        budget = self.time_budget
+        graph = self._cycle_stages(cycle)
+        if budget is None or budget.allows(budget.predict(graph)):
+            return graph
+        shortened = self._cycle_stages(cycle, shortened=True)
+        if budget.allows(budget.predict(shortened)):
+            print(f"\nShortening cycle {cycle} to fit the time budget", flush=True)
+            self.log_event("time_budget", cycle=cycle, action="shorten")
+            return shortened
+        print(f"\nStopping before cycle {cycle} to fit the time budget", flush=True)
+        self.log_event("time_budget", cycle=cycle, action="stop")
+        return None
+
+    def _time_for_refmac(self) -> bool:
+        "Whether another refinement is predicted to fit the time budget"
+        if self.time_budget is None:
+            return True
+        return self.time_budget.allows(mean_job_seconds(self.report, "refmacat"))
+
+    def _time_for_full_data(self) -> bool:
+        "Whether the final refinement of the resolution ramp fits the time budget"
+        if self._time_for_refmac():
+            return True
+        limit = self.resolution_ramp.limit
+        print(f"\nKeeping the data to {limit:.2f} A to fit the time budget", flush=True)
+        self.log_event("time_budget", cycle=self.cycle, action="skip_full_data")
+        return False
+
+    def _cycle_stages(self, cycle: int, shortened: bool = False) -> StageGraph:
+        """
+        Stages in the cycle with the parts of the current model they use.
+        Shortened cycles only include building, Parrot and model selection.
+        """
+        graph = StageGraph()
         if self.args.basic:
-            if self.cycle == 1:
-                self.parrot()
-            self.run_model_building()
+            if cycle == 1:
+                graph.add(
+                    "parrot", self.parrot, _MODEL, ("phases",), self._parrot_jobs()
+                )
+            self._add_model_building(graph)
+            return graph
+
+        def add_optional(name, function):
+            if shortened:
+                return
+            if self.stage_utility is not None:
+                if self.stage_utility.skip(name, cycle):
+                    print(f"Skipping {name} in cycle {cycle} (low gain)", flush=True)
+                    self.log_event("stage_skipped", cycle=cycle, stage=name)
+                    return
+                function = self._measured(name, cycle, function)
+            graph.add(name, function, _MODEL, _MODEL)
+
+        if cycle > 1 and self.resolution < 2.3:
+            add_optional("prune_residues", self.prune)
+        graph.add("parrot", self.parrot, _MODEL, ("phases",), self._parrot_jobs())
+        if self.current_structure is not None:
+            if cycle > 1 or self.args.phases is None:
+                add_optional(
+                    "dummy_atoms", functools.partial(self.findwaters, dummy=True)
+                )
+            graph.add(
+                "remove_dummy_atoms",
+                lambda: remove_residues(self.current_structure, {"HOH", "DUM"}),
+                ("structure",),
+                ("structure",),
+            )
+        self._add_model_building(graph)
+        add_optional("prune_chains", functools.partial(self.prune, chains_only=True))
+        add_optional("waters", self.findwaters)
+        return graph
+
+    def _parrot_jobs(self) -> int:
+        return len(self._parrot_solvents())
+
+    def _measured(self, name: str, cycle: int, function):
+        "Wrap a stage function to record its R-free gain and time"
+
+        def measured():
+            rfree = self.last_refmac.rfree
+            start_time = time.time()
+            function()
+            seconds = time.time() - start_time
+            gain = rfree - self.last_refmac.rfree
+            self.stage_utility.record(name, cycle, gain, seconds)
+
+        return measured
+
+    def _add_model_building(self, graph: StageGraph) -> None:
+        """
+        Buccaneer and nucleic acid building run at the same time if there are
+        parallel jobs, otherwise nucleic acids are built from the Buccaneer result
+        """
+        concurrent = self.args.parallel_jobs > 1
+        graph.add("buccaneer", self.buccaneer, _MODEL, jobs=self.args.build_trials)
+        if concurrent:
+            graph.add("nucleic", self.build_nucleic, _MODEL)
         else:
-            if self.cycle > 1 and self.resolution < 2.3:
-                self.prune()
-            self.parrot()
-            if self.current_structure is not None:
-                if self.cycle > 1 or self.args.phases is None:
-                    self.findwaters(dummy=True)
-                remove_residues(structure=self.current_structure, names={"HOH", "DUM"})
-            self.run_model_building()
-            self.prune(chains_only=True)
-            self.findwaters()
-
-    def run_model_building(self):
-        buccaneer = self.buccaneer()
-        try:
-            nucleic = self.nucleofind(buccaneer)
-            nucleofind = True
-        except FileNotFoundError:
-            nucleic = self.nautilus()
-            nucleofind = False
+            graph.add(
+                "nucleic",
+                lambda: self.build_nucleic(graph.results["buccaneer"]),
+                (*_MODEL, "buccaneer"),
+            )
+        graph.add(
+            "select_model",
+            lambda: self.select_model(
+                graph.results["buccaneer"], *graph.results["nucleic"], concurrent
+            ),
+            ("buccaneer", "nucleic"),
+            _MODEL,
+        )
+
+    @traced("stage")
+    def select_model(self, buccaneer, nucleic, nucleofind: bool, concurrent: bool):
         if buccaneer is None and nucleic is None:
             self.terminate(reason="No residues built")
-        if nucleofind and nucleic is not None:
+        if nucleofind and nucleic is not None and not concurrent:
             self.update_current_from_refmac_result(nucleic)
         elif buccaneer is None or nucleic is None:
             self.update_current_from_refmac_result(buccaneer or nucleic)
         else:
             combined_structure = combine_results(buccaneer, nucleic, self.monlib)
-            combined = self.run_refmac(combined_structure, cycles=5)
+            combined = self.run_refmac(combined_structure, cycles=5, stage="combine")
             best = min((buccaneer, nucleic, combined), key=lambda result: result.rfree)
             self.update_current_from_refmac_result(best)
 
+    def build_nucleic(self, refmac=None) -> tuple:
+        "Returns the refined result and whether it was built by NucleoFind"
+        try:
+            return self.nucleofind(refmac), True
+        except FileNotFoundError:
+            return self.nautilus(), False
+
+    @traced("stage")
     def buccaneer(self):
         if not self.args.contents.proteins:
             return None
+        trials = self._build_trials()
+        if len(trials) == 1:
+            return self._buccaneer_trial(trials[0])
+        functions = [functools.partial(self._buccaneer_trial, t) for t in trials]
+        results = self.run_parallel(*functions)
+        rfrees = [None if result is None else result.rfree for result in results]
+        built = [i for i, result in enumerate(results) if result is not None]
+        if not built:
+            return None
+        chosen = min(built, key=lambda i: rfrees[i])
+        print(f"\nUsing Buccaneer trial {chosen + 1} of {len(trials)}", flush=True)
+        trial = {"cycle": self.cycle, "r_free": rfrees, "chosen": chosen + 1}
+        with self.lock:
+            self.report["build_trials"].append(trial)
+        self.log_event("build_trials", **trial)
+        return results[chosen]
+
+    def _build_trials(self) -> List[dict]:
+        """
+        Starting conditions for the --build-trials Buccaneer runs (the first is the
+        default), leaving out any that would repeat the default for this cycle
+        """
+        trials = [{}]
+        if self.current_structure is not None:
+            trials.append({"input_structure": None})
+        if self.fmean.resolution_high() < _TRIAL_RESOLUTION:
+            trials.append({"resolution": _TRIAL_RESOLUTION})
+        if self.current_fphi_best is not None:
+            trials.append({"fphi": None})
+        if len(trials) < self.args.build_trials:
+            print(
+                f"\nRunning {len(trials)} build trials instead of "
+                f"{self.args.build_trials} because the others would repeat the default",
+                flush=True,
+            )
+        return trials[: self.args.build_trials]
+
+    def _buccaneer_trial(self, options: dict):
+        "Build with Buccaneer and refine, returning None if nothing was built"
+        options = {
+            "input_structure": self.current_structure,
+            "fphi": self.current_fphi_best,
+            **options,
+        }
         result = Buccaneer(
             contents=self.args.contents,
-            fsigf=self.args.fmean,
+            fsigf=self.fmean,
             phases=self.current_phases,
-            fphi=self.current_fphi_best,
-            freer=self.args.freer,
-            input_structure=self.current_structure,
+            freer=self.freer,
             mr_structure=self.args.model,
             use_mr=True,
             filter_mr=True,
             seed_mr=True,
             cycles=3 if self.cycle == 1 else 2,
             threads=self.args.threads,
+            **options,
         ).run(self)
         if (
             result.structure is None
             or ModelStats(result.structure, self.monlib).residues == 0
         ):
             return None
-        write_mmcif(self.path("current.cif"), result.structure)
-        return self.run_refmac(result.structure, cycles=10)
+        with self.lock:
+            write_mmcif(self.path("current.cif"), result.structure)
+        return self.run_refmac(result.structure, cycles=10, stage="buccaneer")
 
+    @traced("stage")
     def nucleofind(self, refmac):
         if not (self.args.contents.rnas or self.args.contents.dnas):
             return None
@@ -197,18 +564,20 @@ class ModelCraftXray(Pipeline):
             or ModelStats(result.structure, self.monlib).residues == 0
         ):
             return None
-        write_mmcif(self.path("current.cif"), result.structure)
-        return self.run_refmac(result.structure, cycles=10)
+        with self.lock:
+            write_mmcif(self.path("current.cif"), result.structure)
+        return self.run_refmac(result.structure, cycles=10, stage="nucleofind")
 
+    @traced("stage")
     def nautilus(self):
         if not (self.args.contents.rnas or self.args.contents.dnas):
             return None
         result = Nautilus(
             contents=self.args.contents,
-            fsigf=self.args.fmean,
+            fsigf=self.fmean,
             phases=self.current_phases,
             fphi=self.current_fphi_best,
-            freer=self.args.freer,
+            freer=self.freer,
             structure=self.current_structure,
         ).run(self)
         if (
@@ -216,11 +585,14 @@ class ModelCraftXray(Pipeline):
             or ModelStats(result.structure, self.monlib).residues == 0
         ):
             return None
-        write_mmcif(self.path("current.cif"), result.structure)
-        return self.run_refmac(result.structure, cycles=10)
+        with self.lock:
+            write_mmcif(self.path("current.cif"), result.structure)
+        return self.run_refmac(result.structure, cycles=10, stage="nautilus")
 
-    def refmac(self, structure: gemmi.Structure, cycles: int, auto_accept: bool):
-        result = self.run_refmac(structure, cycles)
+    def refmac(
+        self, structure: gemmi.Structure, cycles: int, auto_accept: bool, stage: str
+    ):
+        result = self.run_refmac(structure, cycles, stage)
         if auto_accept or result.rfree < self.last_refmac.rfree:
             if not auto_accept:
                 print("(accepted)", flush=True)
@@ -229,48 +601,123 @@ class ModelCraftXray(Pipeline):
             print("(rejected)", flush=True)
             write_mmcif(self.path("current.cif"), self.current_structure)
 
-    def run_refmac(self, structure: gemmi.Structure, cycles: int):
+    def run_refmac(self, structure: gemmi.Structure, cycles: int, stage: str):
         if ModelStats(structure, self.monlib).residues == 0:
             self.terminate(reason="No residues to refine")
         use_phases = self.args.unbiased and (
             self.output_refmac is None or self.output_refmac.rwork > 0.35
         )
-        return Refmac(
+        default_cycles = cycles
+        if self.refmac_cycles is not None:
+            cycles = self.refmac_cycles.choose(stage, default_cycles)
+        result = Refmac(
             structure=structure,
-            fsigf=self.args.fmean,
-            freer=self.args.freer,
+            fsigf=self.fmean,
+            freer=self.freer,
             cycles=cycles,
             phases=self.args.phases if use_phases else None,
             twinned=self.args.twinned,
             libin=self.args.restraints,
+            convergence_tolerance=self.args.refmac_tolerance,
         ).run(self)
+        if self.refmac_cycles is not None:
+            needed = self.refmac_cycles.record(stage, result.rfrees)
+            decision = {
+                "cycle": self.cycle,
+                "stage": stage,
+                "default": default_cycles,
+                "chosen": cycles,
+                "run": result.cycles,
+                "needed": needed,
+            }
+            with self.lock:
+                self.report["refmac_cycles"].append(decision)
+            self.log_event("refmac_cycles", **decision)
+        return result
 
     def update_current_from_refmac_result(self, result):
+        load_all(result)
         self.current_structure = result.structure
         self.current_phases = getattr(result, "abcd", None)
         self.current_fphi_best = result.fphi_best
         self.current_fphi_diff = result.fphi_diff
         self.current_fphi_calc = result.fphi_calc
         self.last_refmac = result
+        self.keep_result(result)
         write_mmcif(self.path("current.cif"), result.structure)
         write_mtz(self.path("current.mtz"), [self.current_fphi_best], ["F,PHI"])
 
+    @traced("stage")
     def parrot(self):
         if self.args.disable_parrot:
             return
-        result = Parrot(
+        solvents = self._parrot_solvents()
+        if len(solvents) == 1:
+            result = self._parrot(solvents[0])
+        else:
+            functions = [functools.partial(self._parrot, s) for s in solvents]
+            results = self.run_parallel(*functions)
+            grid = results[0].fphi.map()
+            size = [grid.nu, grid.nv, grid.nw]
+            grids = [grid] + [result.fphi.map(size=size) for result in results[1:]]
+            skews = protein_skewness(grids, solvents)
+            chosen = max(range(len(results)), key=lambda i: skews[i])
+            result = results[chosen]
+            self.parrot_solvent = solvents[chosen]
+            print(f"\nUsing solvent content {self.parrot_solvent:.3f}", flush=True)
+            sweep = {
+                "cycle": self.cycle,
+                "solvent": solvents,
+                "skewness": skews,
+                "chosen": self.parrot_solvent,
+            }
+            with self.lock:
+                self.report["parrot_solvent_sweep"] = sweep
+            self.log_event("parrot_solvent_sweep", **sweep)
+        self.current_phases = result.abcd
+        self.current_fphi_best = result.fphi
+        write_mtz(self.path("current.mtz"), [self.current_fphi_best], ["F,PHI"])
+
+    def _parrot(self, solvent_content: float = None):
+        return Parrot(
             contents=self.args.contents,
-            fsigf=self.args.fmean,
-            freer=self.args.freer,
+            fsigf=self.fmean,
+            freer=self.freer,
             phases=self.current_phases,
             fphi=self.current_fphi_best,
             structure=self.current_structure,
             monlib=self.monlib,
+            solvent_content=solvent_content,
         ).run(self)
-        self.current_phases = result.abcd
-        self.current_fphi_best = result.fphi
-        write_mtz(self.path("current.mtz"), [self.current_fphi_best], ["F,PHI"])
 
+    def _parrot_solvents(self) -> list:
+        """
+        Solvent contents for the most likely numbers of copies to try in Parrot,
+        or just None to use the usual calculation
+        """
+        sweep = self.args.parrot_solvent_sweep
+        if self.args.disable_parrot or sweep <= 1:
+            return [None]
+        if self.args.contents.copies is not None:
+            return [None]
+        if self.parrot_solvent is not None:
+            return [self.parrot_solvent]
+        if self._parrot_candidates is None:
+            self._parrot_candidates = self._parrot_sweep_candidates(sweep)
+        return self._parrot_candidates
+
+    def _parrot_sweep_candidates(self, sweep: int) -> list:
+        options = copies_options(
+            contents=self.args.contents,
+            cell=self.fmean.cell,
+            spacegroup=self.fmean.spacegroup,
+            resolution=self.fmean.resolution_high(),
+            monlib=self.monlib,
+        )
+        options.sort(key=lambda option: option.probability, reverse=True)
+        return [option.solvent for option in options[:sweep]] or [None]
+
+    @traced("stage")
     def prune(self, chains_only=False):
         if self.args.disable_pruning or not self.args.contents.proteins:
             return
@@ -284,8 +731,10 @@ class ModelCraftXray(Pipeline):
         )
         if pruned:
             write_mmcif(self.path("current.cif"), pruned)
-            self.refmac(pruned, cycles=5, auto_accept=True)
+            stage = "prune_chains" if chains_only else "prune_residues"
+            self.refmac(pruned, cycles=5, auto_accept=True, stage=stage)
 
+    @traced("stage")
     def fixsidechains(self):
         with TemporaryDirectory() as tempdir:
             xyzin = str(Path(tempdir, "input.cif"))
@@ -297,8 +746,11 @@ class ModelCraftXray(Pipeline):
             if os.path.exists(xyzout):
                 structure = gemmi.read_structure(xyzout)
                 write_mmcif(self.path("current.cif"), structure)
-                self.refmac(structure, cycles=5, auto_accept=False)
+                self.refmac(
+                    structure, cycles=5, auto_accept=False, stage="fixsidechains"
+                )
 
+    @traced("stage")
     def findwaters(self, dummy=False):
         if dummy and self.args.disable_dummy_atoms:
             return
@@ -310,7 +762,8 @@ class ModelCraftXray(Pipeline):
             dummy=dummy,
         ).run(self)
         write_mmcif(self.path("current.cif"), result.structure)
-        self.refmac(result.structure, cycles=10, auto_accept=False)
+        stage = "dummy_atoms" if dummy else "waters"
+        self.refmac(result.structure, cycles=10, auto_accept=False, stage=stage)
 
     def process_cycle_output(self, result):
         self._print_refmac_result(result)
@@ -328,11 +781,13 @@ class ModelCraftXray(Pipeline):
         if self.output_refmac is None or result.rwork < self.output_refmac.rwork:
             self.cycles_without_improvement = 0
             self.output_refmac = result
+            self.keep_result(result)
             write_mmcif(self.path("modelcraft.cif"), result.structure)
             result.mtz.write_to_file(self.path("modelcraft.mtz"))
             self.report["final"] = stats
         else:
             self.cycles_without_improvement += 1
+        self.log_event("cycle", **stats)
         self.write_report()
 
     def update_model_cell(self):
@@ -1,5 +1,6 @@
 import os
 import sys
+import threading
 
 import gemmi
 
@@ -56,3 +57,28 @@ class MonLib(gemmi.MonLib):
 
     def weight(self, code: str):
         return sum(atom.el.weight for atom in self[code].atoms)
+
+
+class MonLibCache:
+    """
+    Monomer libraries shared by the pipelines of a batch run.
+    One library is kept for each set of options, and it is replaced
+    by a larger one when a pipeline needs monomers that it does not have.
+    """
+
+    def __init__(self):
+        self._libraries = {}
+        self._lock = threading.Lock()
+
+    def get(self, resnames, libin: str = "", include_standard: bool = False):
+        resnames = frozenset(resnames)
+        key = (libin or "", include_standard)
+        with self._lock:
+            if key in self._libraries:
+                cached_resnames, library = self._libraries[key]
+                if resnames <= cached_resnames:
+                    return library
+                resnames |= cached_resnames
+            library = MonLib(resnames, libin, include_standard)
+            self._libraries[key] = (resnames, library)
+            return library
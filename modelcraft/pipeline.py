@@ -1,10 +1,28 @@
+import asyncio
 import collections
+import concurrent.futures
+import contextlib
+import contextvars
 import dataclasses
-import itertools
 import json
 import os
+import shutil
+import signal
 import sys
+import tempfile
+import threading
 import time
+import weakref
+
+from .artifacts import ArtifactStore
+from .cache import JobCache
+from .checkpoint import Checkpoint
+from .executables import EXECUTABLES, ExecutableRegistry
+from .executor import LocalExecutor
+from .lazy import is_loaded
+from .metrics import MetricsFile
+from .results import ResultStore
+from .trace import start_tracing
 
 
 class Pipeline:
@@ -14,33 +32,187 @@ class Pipeline:
         keep_jobs: bool = False,
         keep_logs: bool = False,
         json_name: str = None,
+        *,
+        parallel_jobs: int = None,
+        cache: JobCache = None,
+        scratch_directory: str = None,
+        job_timeout: float = None,
+        idle_timeout: float = None,
+        executor=None,
+        executables: ExecutableRegistry = None,
+        trace: bool = False,
+        metrics_path: str = None,
+        job_slots: threading.BoundedSemaphore = None,
+        result_memory: int = None,
     ):
-        self._numbers = itertools.count(start=1)
+        self._job_number = 0
+        self._job_slots = job_slots
+        if job_slots is None and parallel_jobs is not None:
+            self._job_slots = threading.BoundedSemaphore(parallel_jobs)
+        self.lock = threading.RLock()
         self.directory = directory
         self.keep_jobs = keep_jobs
         self.keep_logs = keep_logs
         self.json_name = json_name
+        self.cache = cache
+        self.checkpoint = Checkpoint(os.path.join(directory, "checkpoint"))
+        self.scratch_directory = scratch_directory
+        self.job_timeout = job_timeout
+        self.idle_timeout = idle_timeout
+        self.executor = executor or LocalExecutor()
+        self.executables = executables or EXECUTABLES
+        self.processes = set()
+        self.terminating = False
+        self._scratch_root = None
+        self._artifacts = None
+        self._collector = None
+        self._collecting = []
+        self._job_files = []
+        self.result_memory = result_memory
+        self._results = None
         self.seconds = collections.defaultdict(float)
-        self.report = {"seconds": self.seconds, "jobs": []}
+        self.resources = {}
+        self.report = {"seconds": self.seconds, "resources": self.resources, "jobs": []}
+        self.running_jobs = []
+        self.tracer = start_tracing(trace)
+        self.metrics = None
+        if metrics_path is not None:
+            labels = {"directory": os.path.abspath(directory)}
+            self.metrics = MetricsFile(metrics_path, labels)
+        self._events = None
         self.start_time = None
 
     def path(self, *paths: str) -> str:
         return os.path.join(self.directory, *paths)
 
     def next_job_directory(self, name: str) -> str:
-        return self.path(f"job_{next(self._numbers)}_{name}")
+        with self.lock:
+            self._job_number += 1
+            job_name = f"job_{self._job_number}_{name}"
+            if self.scratch_directory is None:
+                return self.path(job_name)
+            if self._scratch_root is None:
+                self._scratch_root = tempfile.mkdtemp(
+                    prefix="modelcraft-", dir=self.scratch_directory
+                )
+            return os.path.join(self._scratch_root, job_name)
 
-    def report_job_start(self, name):
-        if self.start_time is None:
-            self.start_time = time.time()
-        print(name, flush=True)
-        self.report["running_job"] = name
-        self.write_report()
+    def artifact_store(self) -> ArtifactStore:
+        "Store for job input files, next to the job directories so they can be linked"
+        with self.lock:
+            if self._artifacts is None:
+                root = self._scratch_root or self.directory
+                directory = os.path.join(root, "modelcraft-artifacts")
+                self._artifacts = ArtifactStore(directory)
+            return self._artifacts
+
+    def collect_job_directory(self, directory: str) -> None:
+        "Remove a scratch job directory after moving kept files to the output directory"
+        if not self.keep_jobs and not self.keep_logs:
+            shutil.rmtree(directory, ignore_errors=True)
+            return
+        with self.lock:
+            if self._collector is None:
+                self._collector = concurrent.futures.ThreadPoolExecutor(1)
+            self._collecting.append(self._collector.submit(self._collect, directory))
+
+    def add_job_files(self, files: weakref.finalize) -> None:
+        "Job files kept for lazily-loaded results, which are cleaned up by terminate"
+        with self.lock:
+            self._job_files = [other for other in self._job_files if other.alive]
+            self._job_files.append(files)
+
+    def keep_result(self, result) -> None:
+        "Track a result held by the pipeline, which may be spilled to disk when cold"
+        if self.result_memory is None:
+            return
+        with self.lock:
+            if self._results is None:
+                root = self._scratch_root or self.directory
+                directory = os.path.join(root, "modelcraft-results")
+                self._results = ResultStore(directory, self.result_memory)
+        self._results.add(result)
+
+    def _collect(self, directory: str) -> None:
+        name = os.path.basename(directory)
+        if self.keep_jobs:
+            shutil.move(directory, self.path(name))
+            if self._artifacts is not None:
+                self._artifacts.prune()
+            return
+        os.makedirs(self.path("modelcraft-logs"), exist_ok=True)
+        for filename in ("stdout.txt", "stderr.txt", "script.sh"):
+            src = os.path.join(directory, filename)
+            dst = self.path("modelcraft-logs", f"{name}_{filename}")
+            shutil.move(src, dst)
+        shutil.rmtree(directory, ignore_errors=True)
+        if self._artifacts is not None:
+            self._artifacts.prune()
+
+    def clean_scratch(self) -> None:
+        "Wait for kept files to be moved then remove the scratch directory"
+        for future in self._collecting:
+            exception = future.exception()
+            if exception is not None:
+                print(f"Warning: could not collect job files: {exception}", flush=True)
+        self._collecting = []
+        if self._scratch_root is not None:
+            shutil.rmtree(self._scratch_root, ignore_errors=True)
+            self._scratch_root = None
+        self._artifacts = None
+
+    def check_executables(self, names) -> None:
+        "Find programs before running any jobs and stop if any are missing"
+        missing = self.executables.check(names)
+        self.report["executables"] = self.executables.report()
+        if missing:
+            print(f"Required programs not found: {', '.join(missing)}", flush=True)
+            self.terminate(reason="Required programs not found", exit_code=1)
+
+    def save_checkpoint(self, name: str, state: dict) -> None:
+        "Save state along with the report so that --resume can continue from here"
+        with self.lock:
+            pipeline = {
+                "job_number": self._job_number,
+                "elapsed": time.time() - self.start_time,
+                "report": self.report,
+            }
+            self.checkpoint.save(name, {**state, "pipeline": pipeline})
 
-    def report_job_finish(self, result):
-        name = self.report.pop("running_job")
+    def load_checkpoint(self, name: str) -> dict:
+        "Saved state (if any) after restoring the report and job numbering"
+        state = self.checkpoint.load(name)
+        if state is None:
+            return None
+        pipeline = state.pop("pipeline")
+        report = pipeline["report"]
+        if _without_resume(report["args"]) != _without_resume(self.report["args"]):
+            print("The arguments are different from the checkpointed run", flush=True)
+            self.terminate(reason="Cannot resume", exit_code=1)
+        with self.lock:
+            self._job_number = max(self._job_number, pipeline["job_number"])
+            self.start_time = time.time() - pipeline["elapsed"]
+            self.seconds.update(report.pop("seconds"))
+            self.resources.update(report.pop("resources"))
+            for key in ("args", "version", "executables"):
+                report.pop(key, None)
+            self.report.update(report)
+        return state
+
+    def report_job_start(self, name, directory: str = None):
+        with self.lock:
+            if self.start_time is None:
+                self.start_time = time.time()
+            print(name, flush=True)
+            self.running_jobs.append(name)
+            self._update_running_job()
+            self.log_event("job_start", name=name, directory=directory)
+
+    def report_job_finish(self, name, result, resources: dict = None):
         result_dict = {}
         for field in dataclasses.fields(result):
+            if not is_loaded(result, field.name):
+                continue
             value = getattr(result, field.name)
             try:
                 json.dumps(value)
@@ -48,18 +220,167 @@ class Pipeline:
                 pass
             else:
                 result_dict[field.name] = value
-        print(json.dumps(result_dict, indent=4), flush=True)
-        self.report["jobs"].append({"name": name, **result_dict})
-        self.write_report()
+        with self.lock:
+            self.running_jobs.remove(name)
+            self._update_running_job()
+            print(json.dumps(result_dict, indent=4), flush=True)
+            job_dict = {"name": name, **result_dict}
+            if resources is not None:
+                job_dict["resources"] = resources
+                self._add_resources(name, resources)
+            self.report["jobs"].append(job_dict)
+            self.log_event("job_finish", **job_dict)
+
+    def report_job_failure(self, name, error: Exception):
+        with self.lock:
+            if name in self.running_jobs:
+                self.running_jobs.remove(name)
+                self._update_running_job()
+            message = str(error).strip()
+            self.log_event(
+                "job_failure", name=name, error=type(error).__name__, message=message
+            )
+
+    def _add_resources(self, name: str, resources: dict):
+        "Aggregate job resources per executable (peak memory and totals of the rest)"
+        totals = self.resources.setdefault(name, {"jobs": 0})
+        totals["jobs"] += 1
+        for key, value in resources.items():
+            if key == "max_rss_kb":
+                totals[key] = max(totals.get(key, 0), value)
+            else:
+                totals[key] = totals.get(key, 0) + value
+
+    def _update_running_job(self):
+        if self.running_jobs:
+            self.report["running_job"] = ", ".join(self.running_jobs)
+        else:
+            self.report.pop("running_job", None)
+
+    def job_slot(self):
+        "Context manager that limits the number of programs running at once"
+        return self._job_slots or contextlib.nullcontext()
+
+    async def acquire_job_slot_async(self) -> None:
+        "Wait for a job slot without blocking the event loop or its thread pool"
+        if self._job_slots is not None:
+            while not self._job_slots.acquire(blocking=False):
+                await asyncio.sleep(0.1)
+
+    def release_job_slot(self) -> None:
+        if self._job_slots is not None:
+            self._job_slots.release()
+
+    def add_process(self, process) -> None:
+        with self.lock:
+            self.processes.add(process)
+            if self.terminating:
+                kill_process_group(process)
+
+    def remove_process(self, process) -> None:
+        with self.lock:
+            self.processes.discard(process)
+
+    def kill_processes(self) -> None:
+        "Kill the process groups of all running jobs"
+        with self.lock:
+            for process in self.processes:
+                kill_process_group(process)
+        self.executor.cancel()
+
+    def handle_signals(self) -> None:
+        "Kill running jobs and write the report on SIGINT or SIGTERM"
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self._handle_signal)
+            signal.signal(signal.SIGTERM, self._handle_signal)
+
+    def _handle_signal(self, signum, _frame):
+        if self.terminating:
+            return
+        name = signal.Signals(signum).name
+        self.terminate(reason=f"Received {name}", exit_code=128 + signum)
+
+    def run_parallel(self, *functions) -> list:
+        "Call functions in separate threads and return the results in the same order"
+        with concurrent.futures.ThreadPoolExecutor(len(functions)) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, function)
+                for function in functions
+            ]
+            return [future.result() for future in futures]
+
+    def run_jobs(self, *jobs) -> list:
+        "Run independent jobs concurrently and return the results in the same order"
+        return asyncio.run(self.run_jobs_async(*jobs))
+
+    async def run_jobs_async(self, *jobs) -> list:
+        return await asyncio.gather(*(job.run_async(self) for job in jobs))
+
+    def log_event(self, event: str, **fields) -> None:
+        "Append an event to the JSON lines log next to the report"
+        with self.lock:
+            if self.json_name:
+                if self._events is None:
+                    stem = os.path.splitext(self.json_name)[0]
+                    path = self.path(f"{stem}.events.jsonl")
+                    self._events = open(path, "a", encoding="utf-8")
+                line = json.dumps({"time": time.time(), "event": event, **fields})
+                self._events.write(line + "\n")
+                self._events.flush()
+            if self.metrics is not None:
+                self.metrics.update(event, fields, self)
 
     def write_report(self):
+        "Write the summary report (at cycle boundaries and on termination)"
         if self.json_name:
-            self.seconds["total"] = time.time() - self.start_time
-            with open(self.path(self.json_name), "w", encoding="utf-8") as report_file:
-                json.dump(self.report, report_file, indent=4)
+            with self.lock:
+                self.seconds["total"] = time.time() - self.start_time
+                path = self.path(self.json_name)
+                with open(path, "w", encoding="utf-8") as report_file:
+                    json.dump(self.report, report_file, indent=4)
 
-    def terminate(self, reason: str):
+    def terminate(self, reason: str, exit_code: int = 0):
+        with self.lock:
+            self.terminating = True
+        self.kill_processes()
         print(f"\n--- Termination: {reason} ---", flush=True)
         self.report["termination_reason"] = reason
+        self.log_event("termination", reason=reason, exit_code=exit_code)
+        if self._events is not None:
+            self._events.close()
+            self._events = None
+        for files in list(self._job_files):
+            files()
+        if self._artifacts is not None:
+            self._artifacts.remove()
+        if self._results is not None:
+            self._results.remove()
+            self._results = None
+        self.clean_scratch()
         self.write_report()
-        sys.exit()
+        if self.tracer is not None and self.json_name:
+            stem = os.path.splitext(self.json_name)[0]
+            self.tracer.write(self.path(f"{stem}.trace.json"))
+        sys.exit(exit_code)
+
+
+def _without_resume(args: list) -> list:
+    return [arg for arg in args if arg != "--resume"]
+
+
+# Jobs are started in a new session, and so a new process group,
+# where the group can be killed (not on Windows)
+PROCESS_GROUPS = hasattr(os, "killpg")
+
+
+def kill_process_group(process) -> None:
+    "Kill a job process and any processes that it started"
+    if process.returncode is not None:
+        return
+    try:
+        if PROCESS_GROUPS:
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
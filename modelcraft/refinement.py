@@ -0,0 +1,78 @@
+import collections
+import dataclasses
+import math
+from typing import List
+
+
+class AdaptiveCycles:
+    "Refmac cycle counts for each stage chosen from how quickly R-free converged"
+
+    def __init__(self, minimum: int, maximum: int, tolerance: float, history: int = 3):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.history = history
+        self.needed = collections.defaultdict(list)
+
+    def choose(self, stage: str, default: int) -> int:
+        "Most cycles needed in recent runs at the stage (or the default) within bounds"
+        recent = self.needed[stage][-self.history :]
+        cycles = max(recent) if recent else default
+        return min(max(cycles, self.minimum), self.maximum)
+
+    def record(self, stage: str, rfrees: List[float]) -> int:
+        """
+        Record and return the cycles needed for a run with R-free values
+        before the first cycle and after each cycle.
+        If R-free stopped changing, one more cycle than the last change is needed,
+        otherwise half as many cycles again are needed.
+        """
+        cycles = len(rfrees) - 1
+        changed = [
+            cycle
+            for cycle in range(1, cycles + 1)
+            if abs(rfrees[cycle] - rfrees[cycle - 1]) >= self.tolerance
+        ]
+        last_change = changed[-1] if changed else 0
+        if last_change < cycles:
+            needed = last_change + 1
+        else:
+            needed = cycles + math.ceil(cycles / 2)
+        self.needed[stage].append(needed)
+        return needed
+
+
+@dataclasses.dataclass
+class ResolutionRamp:
+    """
+    High-resolution limits for the early cycles, stepping from the start limit
+    to the full data in equal steps.
+    The limit steps each time R-free falls below the next threshold
+    and when R-free stops improving at the current limit.
+    """
+
+    start: float
+    full: float
+    thresholds: List[float] = dataclasses.field(default_factory=lambda: [0.45, 0.38])
+    step: int = 0
+
+    @property
+    def limit(self) -> float:
+        fraction = self.step / len(self.thresholds)
+        return self.start + (self.full - self.start) * fraction
+
+    @property
+    def finished(self) -> bool:
+        return self.step == len(self.thresholds)
+
+    def update(self, rfree: float, improved: bool) -> bool:
+        "Step the limit after a cycle and return whether it changed"
+        step = self.step
+        while not self.finished and rfree < self.thresholds[self.step]:
+            self.step += 1
+        if not improved and self.step == step and not self.finished:
+            self.step += 1
+        return self.step != step
+
+    def finish(self) -> None:
+        self.step = len(self.thresholds)
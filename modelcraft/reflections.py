@@ -7,6 +7,8 @@ import gemmi
 import numpy
 import pandas
 
+from .trace import traced
+
 
 class ColumnRef:
     def __init__(
@@ -136,6 +138,19 @@ class DataItem(gemmi.Mtz):
                 yield cls(mtz, combination)
 
 
+def truncate_resolution(item: DataItem, resolution: float) -> DataItem:
+    "Copy of the data item without the reflections beyond the resolution limit"
+    data = numpy.array(item, copy=False)
+    mtz = gemmi.Mtz(with_base=True)
+    mtz.cell = item.cell
+    mtz.spacegroup = item.spacegroup
+    for column in item.columns[3:]:
+        mtz.add_column(column.label, column.type)
+    mtz.set_data(data[item.make_d_array() >= resolution])
+    return DataItem(mtz, list(mtz.columns)[3:])
+
+
+@traced()
 def write_mtz(
     path: str, items: List[DataItem], labels: Optional[List[str]] = None
 ) -> None:
@@ -0,0 +1,129 @@
+import functools
+import os
+import shutil
+import threading
+import weakref
+from typing import List
+
+import gemmi
+import numpy
+
+from .lazy import Lazy, all_loaded, is_lazy_field, keep_files
+from .reflections import DataItem
+from .structure import read_structure, write_mmcif
+from .utils import puid
+
+_ATOM_BYTES = 200
+
+
+class ResultStore:
+    """
+    Job results held by a pipeline, kept in memory up to a limit in bytes.
+    Above the limit, the least recently added results are spilled to files
+    (structures as mmCIF and reflections as column arrays)
+    and their fields are read back lazily when next used.
+    The most recently added result is always kept in memory.
+    Spilling only frees the memory of fields that are not also referenced elsewhere
+    (e.g. as the current model of a pipeline).
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.spilled = 0
+        self._lock = threading.Lock()
+        self._results: List[weakref.ref] = []
+        self._files: List[weakref.finalize] = []
+
+    def add(self, result) -> None:
+        "Mark the result as the most recently used and spill older ones if needed"
+        with self._lock:
+            alive = [ref for ref in self._results if ref() is not None]
+            self._results = [ref for ref in alive if ref() is not result]
+            self._results.append(weakref.ref(result))
+            self._files = [files for files in self._files if files.alive]
+            total = sum(resident_bytes(ref()) for ref in self._results)
+            for ref in self._results[:-1]:
+                if total <= self.max_bytes:
+                    break
+                older = ref()
+                if older is not None and all_loaded(older):
+                    size = resident_bytes(older)
+                    if size > 0:
+                        self._spill(older)
+                        total -= size
+
+    def remove(self) -> None:
+        with self._lock:
+            for files in self._files:
+                files()
+            self._files = []
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _spill(self, result) -> None:
+        directory = os.path.join(self.directory, puid())
+        os.makedirs(directory)
+        for name, value in list(vars(result).items()):
+            if not is_lazy_field(result, name):
+                continue
+            path = os.path.join(directory, name)
+            for type_, extension, write, read in (
+                (DataItem, "npz", _write_data_item, _read_data_item),
+                (gemmi.Mtz, "mtz", _write_mtz, gemmi.read_mtz_file),
+                (gemmi.Structure, "cif", write_mmcif, read_structure),
+            ):
+                if isinstance(value, type_):
+                    write(f"{path}.{extension}", value)
+                    load = functools.partial(read, f"{path}.{extension}")
+                    setattr(result, name, Lazy(load))
+                    break
+        cleanup = functools.partial(shutil.rmtree, directory, ignore_errors=True)
+        self._files.append(keep_files(result, cleanup))
+        self.spilled += 1
+
+
+def resident_bytes(result) -> int:
+    "Approximate memory used by the loaded structures and reflections that can spill"
+    if result is None:
+        return 0
+    total = 0
+    for name, value in vars(result).items():
+        if not is_lazy_field(result, name):
+            continue
+        if isinstance(value, gemmi.Mtz):
+            total += numpy.array(value, copy=False).nbytes
+        elif isinstance(value, gemmi.Structure):
+            total += sum(model.count_atom_sites() for model in value) * _ATOM_BYTES
+    return total
+
+
+def _write_data_item(path: str, item: DataItem) -> None:
+    columns = {
+        f"column_{i}": numpy.array(column) for i, column in enumerate(item.columns)
+    }
+    numpy.savez(
+        path,
+        labels=numpy.array(item.column_labels()),
+        types=numpy.array([column.type for column in item.columns]),
+        cell=numpy.array(item.cell.parameters),
+        spacegroup=numpy.array(item.spacegroup.hm),
+        **columns,
+    )
+
+
+def _read_data_item(path: str) -> DataItem:
+    with numpy.load(path) as arrays:
+        labels = [str(label) for label in arrays["labels"]]
+        types = [str(type_) for type_ in arrays["types"]]
+        mtz = gemmi.Mtz(with_base=True)
+        mtz.cell = gemmi.UnitCell(*arrays["cell"])
+        mtz.spacegroup = gemmi.SpaceGroup(str(arrays["spacegroup"]))
+        for label, type_ in zip(labels[3:], types[3:]):
+            mtz.add_column(label, type_)
+        columns = [arrays[f"column_{i}"] for i in range(len(labels))]
+        mtz.set_data(numpy.stack(columns, axis=1))
+    return DataItem(mtz, list(mtz.columns)[3:])
+
+
+def _write_mtz(path: str, mtz: gemmi.Mtz) -> None:
+    mtz.write_to_file(path)
@@ -0,0 +1,64 @@
+"Inspect and prune a ModelCraft --cache-dir cache"
+
+import argparse
+import sys
+import time
+
+from tabulate import tabulate
+
+from ..cache import JobCache
+
+
+def _parse_args(argument_list):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory", help="Path to the cache directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("info", help="Print the number of entries and total size")
+    subparsers.add_parser("list", help="List entries with the most recently used last")
+    prune = subparsers.add_parser(
+        "prune", help="Remove the least recently used entries"
+    )
+    prune.add_argument(
+        "--max-size",
+        type=float,
+        required=True,
+        metavar="X",
+        help="Size in gigabytes to reduce the cache to",
+    )
+    subparsers.add_parser("clear", help="Remove all entries")
+    return parser.parse_args(argument_list or sys.argv[1:])
+
+
+def main(argument_list=None):
+    args = _parse_args(argument_list)
+    cache = JobCache(args.directory)
+    if args.command == "info":
+        entries = cache.entries()
+        size = sum(entry["size"] for entry in entries)
+        seconds = sum(entry["seconds"] for entry in entries)
+        print(f"Entries     {len(entries)}")
+        print(f"Size (GB)   {size / 1e9:.3f}")
+        print(f"Run time    {seconds:.0f} seconds")
+    elif args.command == "list":
+        rows = [
+            (
+                entry["key"][:16],
+                entry["executable"],
+                entry["size"] / 1e6,
+                entry["seconds"],
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["used"])),
+            )
+            for entry in cache.entries()
+        ]
+        headers = ["Key", "Executable", "Size (MB)", "Seconds", "Last used"]
+        print(tabulate(rows, headers=headers, floatfmt=".1f"))
+    elif args.command == "prune":
+        removed = cache.prune(int(args.max_size * 1e9))
+        print(f"Removed {removed} entries")
+    elif args.command == "clear":
+        removed = cache.prune(0)
+        print(f"Removed {removed} entries")
+
+
+if __name__ == "__main__":
+    main()
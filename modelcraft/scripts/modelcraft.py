@@ -1,6 +1,7 @@
 import sys
 
 from ..arguments import parse
+from ..batch import run_batch
 from ..environ import setup_environ
 from ..modelcraftem import ModelCraftEm
 from ..modelcraftxray import ModelCraftXray
@@ -10,8 +11,16 @@ def main(args=None):
     setup_environ()
     raw_args = args or sys.argv[1:]
     parsed_args = parse(args)
-    pipeline = ModelCraftEm if parsed_args.mode == "em" else ModelCraftXray
-    pipeline(parsed_args, raw_args).run()
+    if parsed_args.mode == "batch":
+        sys.exit(run_batch(parsed_args))
+    pipeline_class = ModelCraftEm if parsed_args.mode == "em" else ModelCraftXray
+    pipeline = pipeline_class(parsed_args, raw_args)
+    pipeline.handle_signals()
+    try:
+        pipeline.run()
+    except TimeoutError as error:
+        print(error, flush=True)
+        pipeline.terminate(reason="Job timed out", exit_code=1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+"Run ModelCraft jobs submitted to a shared --spool-dir directory"
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+from ..executor import SPOOL_FOLDERS
+from ..job import _resource_usage
+from ..pipeline import PROCESS_GROUPS, kill_process_group
+
+
+def _parse_args(argument_list):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory", help="Path to the shared spool directory")
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=1.0,
+        metavar="X",
+        help="Seconds to wait between checks for new jobs",
+    )
+    parser.add_argument(
+        "--exit-when-idle",
+        type=float,
+        metavar="X",
+        help="Exit after this many seconds without any pending jobs",
+    )
+    return parser.parse_args(argument_list or sys.argv[1:])
+
+
+def main(argument_list=None):
+    args = _parse_args(argument_list)
+    for folder in SPOOL_FOLDERS:
+        os.makedirs(os.path.join(args.directory, folder), exist_ok=True)
+    idle_since = time.time()
+    while True:
+        ticket = _claim(args.directory)
+        if ticket is not None:
+            print(f"Running {ticket}", flush=True)
+            _run(args.directory, ticket, args.poll)
+            idle_since = time.time()
+        elif (
+            args.exit_when_idle is not None
+            and time.time() - idle_since > args.exit_when_idle
+        ):
+            break
+        else:
+            time.sleep(args.poll)
+
+
+def _claim(spool: str):
+    "Move the oldest pending job to running and return its name (if any)"
+    pending = os.path.join(spool, "pending")
+    for ticket in sorted(os.listdir(pending)):
+        running = os.path.join(spool, "running", ticket)
+        try:
+            os.rename(os.path.join(pending, ticket), running)
+            os.utime(running)
+        except OSError:
+            continue
+        return ticket
+    return None
+
+
+def _run(spool: str, ticket: str, poll: float) -> None:
+    directory = os.path.join(spool, "running", ticket)
+    with open(os.path.join(directory, "ticket.json"), encoding="utf-8") as stream:
+        limits = json.load(stream)
+    start_time = last_output_time = time.time()
+    process = subprocess.Popen(
+        ["bash", "script.sh"], cwd=directory, start_new_session=PROCESS_GROUPS
+    )
+    sizes = None
+    stopped_reason = None
+    while True:
+        returncode, resources = _poll(process)
+        if returncode is not None:
+            break
+        now = time.time()
+        new_sizes = [
+            os.path.getsize(os.path.join(directory, filename))
+            for filename in ("stdout.txt", "stderr.txt")
+            if os.path.exists(os.path.join(directory, filename))
+        ]
+        if new_sizes != sizes:
+            sizes = new_sizes
+            last_output_time = now
+        withdrawn = not _heartbeat(directory)
+        timeout = limits.get("timeout")
+        idle_timeout = limits.get("idle_timeout")
+        if stopped_reason is None:
+            if withdrawn or os.path.exists(os.path.join(directory, "cancel")):
+                stopped_reason = "it was cancelled"
+            elif timeout is not None and now - start_time > timeout:
+                stopped_reason = f"it ran for over {timeout:g} seconds"
+            elif idle_timeout is not None and now - last_output_time > idle_timeout:
+                stopped_reason = f"it wrote no output for {idle_timeout:g} seconds"
+            if stopped_reason is not None:
+                kill_process_group(process)
+        time.sleep(min(poll, 0.5))
+    if os.path.exists(os.path.join(directory, "cancel")) or not _heartbeat(directory):
+        shutil.rmtree(directory, ignore_errors=True)
+        return
+    result = {
+        "host": socket.gethostname(),
+        "returncode": returncode,
+        "seconds": time.time() - start_time,
+        "resources": resources,
+        "stopped_reason": stopped_reason,
+    }
+    try:
+        path = os.path.join(directory, "result.json")
+        with open(path, "w", encoding="utf-8") as stream:
+            json.dump(result, stream, indent=4)
+        os.rename(directory, os.path.join(spool, "done", ticket))
+    except FileNotFoundError:
+        print(f"{ticket} was withdrawn by the pipeline", flush=True)
+
+
+def _poll(process: subprocess.Popen) -> tuple:
+    "Return code and resource usage if the process has finished (or None and None)"
+    if not hasattr(os, "wait4"):
+        return process.poll(), None
+    pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+    if pid == 0:
+        return None, None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, _resource_usage(rusage)
+
+
+def _heartbeat(directory: str) -> bool:
+    "Show the pipeline that the job is still running and return if it is still wanted"
+    try:
+        os.utime(directory)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    main()
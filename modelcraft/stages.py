@@ -0,0 +1,141 @@
+import collections
+import concurrent.futures
+import contextvars
+import dataclasses
+import time
+from typing import Callable, Dict, List, Set, Tuple
+
+
+@dataclasses.dataclass
+class Stage:
+    name: str
+    function: Callable[[], object]
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    jobs: int = 1
+    dependencies: Set[str] = dataclasses.field(default_factory=set)
+
+
+class StageGraph:
+    """
+    Stages that declare the state they read (inputs) and write (outputs).
+    Each stage also outputs its own name, which holds its return value in results.
+    A stage runs after the last earlier writer of its inputs and outputs
+    and after the earlier readers of its outputs,
+    so running the stages in the order they were added is always valid.
+    """
+
+    def __init__(self):
+        self.stages: List[Stage] = []
+        self.results: Dict[str, object] = {}
+        self.seconds: Dict[str, float] = {}
+        self._writers: Dict[str, str] = {}
+        self._readers: Dict[str, List[str]] = {}
+
+    def add(
+        self,
+        name: str,
+        function: Callable[[], object],
+        inputs: Tuple[str, ...] = (),
+        outputs: Tuple[str, ...] = (),
+        jobs: int = 1,
+    ) -> Stage:
+        if any(stage.name == name for stage in self.stages):
+            raise ValueError(f"Stage '{name}' has already been added")
+        stage = Stage(name, function, tuple(inputs), tuple(outputs), jobs)
+        for key in stage.inputs:
+            if key in self._writers:
+                stage.dependencies.add(self._writers[key])
+        for key in (*stage.outputs, name):
+            if key in self._writers:
+                stage.dependencies.add(self._writers[key])
+            stage.dependencies.update(self._readers.get(key, []))
+        for key in stage.inputs:
+            self._readers.setdefault(key, []).append(name)
+        for key in (*stage.outputs, name):
+            self._writers[key] = name
+            self._readers[key] = []
+        stage.dependencies.discard(name)
+        self.stages.append(stage)
+        return stage
+
+    def run(self, budget: int = 1) -> Dict[str, object]:
+        """
+        Run the stages with up to budget jobs at once and return the results.
+        The time taken by each stage is recorded in seconds.
+        A stage that needs more jobs than the budget runs on its own.
+        """
+        if budget <= 1:
+            for stage in self.stages:
+                self.results[stage.name] = self._run_stage(stage)
+            return self.results
+        pending = list(self.stages)
+        running = {}
+        with concurrent.futures.ThreadPoolExecutor(budget) as executor:
+            while pending or running:
+                used = sum(stage.jobs for stage in running.values())
+                for stage in list(pending):
+                    ready = stage.dependencies.issubset(self.results)
+                    fits = not running or used + stage.jobs <= budget
+                    if ready and fits:
+                        context = contextvars.copy_context()
+                        future = executor.submit(context.run, self._run_stage, stage)
+                        running[future] = stage
+                        pending.remove(stage)
+                        used += stage.jobs
+                finished, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in finished:
+                    stage = running.pop(future)
+                    self.results[stage.name] = future.result()
+        return self.results
+
+    def _run_stage(self, stage: Stage) -> object:
+        start_time = time.time()
+        result = stage.function()
+        self.seconds[stage.name] = time.time() - start_time
+        return result
+
+
+class StageUtility:
+    """
+    R-free gain and time of optional stages.
+    After a number of runs in a row that improve R-free by less than the minimum
+    gain per minute, a stage is skipped for a back-off period of cycles
+    and then tried again, with the back-off doubling each time it is still poor.
+    """
+
+    def __init__(
+        self, min_gain_per_minute: float, poor_runs: int = 2, backoff: int = 2
+    ):
+        self.min_gain_per_minute = min_gain_per_minute
+        self.poor_runs = poor_runs
+        self.backoff = backoff
+        self.history: Dict[str, List[dict]] = collections.defaultdict(list)
+        self._poor = collections.Counter()
+        self._backoffs = {}
+        self._skip_until = {}
+
+    def replay(self, history: Dict[str, List[dict]]) -> None:
+        "Record the runs from a previous history (e.g. from a resumed report)"
+        for stage, runs in history.items():
+            for run in runs:
+                self.record(stage, run["cycle"], run["gain"], run["seconds"])
+
+    def skip(self, stage: str, cycle: int) -> bool:
+        return cycle < self._skip_until.get(stage, 0)
+
+    def record(self, stage: str, cycle: int, gain: float, seconds: float) -> None:
+        run = {"cycle": cycle, "gain": gain, "seconds": seconds}
+        self.history[stage].append(run)
+        if gain / max(seconds, 1) * 60 >= self.min_gain_per_minute:
+            self._poor[stage] = 0
+            self._backoffs.pop(stage, None)
+            return
+        self._poor[stage] += 1
+        if self._poor[stage] >= self.poor_runs:
+            backoff = self._backoffs.get(stage, self.backoff)
+            self._skip_until[stage] = cycle + 1 + backoff
+            self._backoffs[stage] = backoff * 2
+            self._poor[stage] = self.poor_runs - 1
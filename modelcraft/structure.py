@@ -3,6 +3,7 @@ from typing import Iterator
 import gemmi
 
 from .monlib import MonLib
+from .trace import traced
 
 
 def read_structure(path: str) -> gemmi.Structure:
@@ -39,6 +40,7 @@ def remove_non_protein(structure: gemmi.Structure) -> None:
                         del subchain[i]
 
 
+@traced()
 def write_mmcif(path: str, structure: gemmi.Structure) -> None:
     groups = gemmi.MmcifOutputGroups(True)
     groups.title_keywords = False
@@ -57,13 +57,16 @@ def insulin_structure():
     return read_structure(pdb_path)
 
 
-@functools.lru_cache(maxsize=None)
-def insulin_refmac():
+def insulin_refmac_job(cycles: int = 0) -> Refmac:
     fsigf = insulin_fsigf()
     freer = insulin_freer()
     structure = insulin_structure()
-    refmac = Refmac(structure=structure, fsigf=fsigf, freer=freer, cycles=0)
-    return refmac.run()
+    return Refmac(structure=structure, fsigf=fsigf, freer=freer, cycles=cycles)
+
+
+@functools.lru_cache(maxsize=None)
+def insulin_refmac():
+    return insulin_refmac_job().run()
 
 
 @functools.lru_cache(maxsize=None)
@@ -46,3 +46,25 @@ def test_freer_fraction_error():
     args += ["--data", "r102dsf.mtz"]
     with pytest.raises(SystemExit):
         parse(args)
+
+
+def test_parallel_jobs_error():
+    seqin = ccp4_path("examples", "data", "gere.seq")
+    hklin = ccp4_path("examples", "data", "gere.mtz")
+    args = ["xray"]
+    args += ["--contents", seqin]
+    args += ["--data", hklin]
+    args += ["--parallel-jobs", "0"]
+    with pytest.raises(SystemExit):
+        parse(args)
+
+
+def test_build_trials_error():
+    seqin = ccp4_path("examples", "data", "gere.seq")
+    hklin = ccp4_path("examples", "data", "gere.mtz")
+    args = ["xray"]
+    args += ["--contents", seqin]
+    args += ["--data", hklin]
+    args += ["--build-trials", "5"]
+    with pytest.raises(SystemExit):
+        parse(args)
@@ -0,0 +1,45 @@
+import csv
+import json
+import os
+
+import pytest
+
+from ...reflections import write_mtz
+from ...scripts.modelcraft import main
+from . import (
+    in_temp_directory,
+    insulin_contents,
+    insulin_freer,
+    insulin_fsigf,
+    insulin_refmac,
+)
+
+
+@in_temp_directory
+def test_insulin_batch():
+    write_mtz("data.mtz", [insulin_fsigf(), insulin_freer(), insulin_refmac().abcd])
+    insulin_contents().write_json_file("contents.json")
+    with open("corrupt.mtz", "w", encoding="utf-8") as stream:
+        stream.write("Not an MTZ file")
+    with open("manifest.csv", "w", encoding="utf-8", newline="") as stream:
+        writer = csv.writer(stream)
+        writer.writerow(["name", "mode", "data", "contents", "cycles", "basic"])
+        writer.writerow(["first", "xray", "data.mtz", "contents.json", "1", "true"])
+        writer.writerow(["second", "xray", "data.mtz", "missing.json", "1", "true"])
+        writer.writerow(["third", "xray", "corrupt.mtz", "contents.json", "1", "true"])
+    with pytest.raises(SystemExit) as exit_info:
+        main(["batch", "manifest.csv", "--directory", "batch", "--parallel-jobs", "2"])
+    assert exit_info.value.code == 1
+    with open(os.path.join("batch", "summary.csv"), encoding="utf-8") as stream:
+        rows = {row["name"]: row for row in csv.DictReader(stream)}
+    assert rows["second"]["status"] == "Invalid arguments"
+    with open(os.path.join("batch", "second.log"), encoding="utf-8") as stream:
+        assert "missing.json" in stream.read()
+    assert rows["third"]["status"].startswith("Error")
+    assert rows["third"]["exit_code"] == "1"
+    assert os.path.exists(os.path.join("batch", "first.log"))
+    with open(
+        os.path.join("batch", "first", "modelcraft.json"), encoding="utf-8"
+    ) as stream:
+        report = json.load(stream)
+    assert rows["first"]["status"] == report["termination_reason"]
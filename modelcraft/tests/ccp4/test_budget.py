@@ -0,0 +1,24 @@
+from ...budget import TimeBudget, mean_job_seconds
+from ...stages import StageGraph
+
+
+def test_time_budget():
+    budget = TimeBudget(seconds=60)
+    graph = StageGraph()
+    graph.add("first", lambda: None)
+    graph.add("second", lambda: None)
+    assert budget.predict(graph) is None
+    assert budget.allows(None)
+    budget.stage_seconds.update({"first": 10, "second": 30})
+    assert budget.predict(graph) == 40
+    graph.add("third", lambda: None)
+    assert budget.predict(graph) == 60
+    assert budget.allows(30)
+    assert not budget.allows(70)
+
+
+def test_mean_job_seconds():
+    report = {"jobs": [{"name": "refmacat", "seconds": 2}, {"name": "refmacat"}]}
+    report["jobs"].append({"name": "refmacat", "seconds": 4})
+    assert mean_job_seconds(report, "refmacat") == 3
+    assert mean_job_seconds(report, "cbuccaneer") is None
@@ -0,0 +1,26 @@
+from ...cache import JobCache
+from ...pipeline import Pipeline
+from ...scripts.cache import main
+from . import in_temp_directory, insulin_refmac_job
+
+
+@in_temp_directory
+def test_cached_refmac():
+    cache = JobCache("cache")
+    pipeline = Pipeline(cache=cache)
+    result1 = insulin_refmac_job(cycles=1).run(pipeline)
+    result2 = insulin_refmac_job(cycles=1).run(pipeline)
+    assert len(cache.entries()) == 1
+    assert result2.rfree == result1.rfree
+    assert result2.structure is not None
+    assert result2.seconds < result1.seconds
+
+
+@in_temp_directory
+def test_prune():
+    cache = JobCache("cache")
+    insulin_refmac_job(cycles=1).run(Pipeline(cache=cache))
+    assert cache.size() > 0
+    main(["cache", "list"])
+    main(["cache", "prune", "--max-size", "0"])
+    assert len(cache.entries()) == 0
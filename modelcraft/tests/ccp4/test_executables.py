@@ -0,0 +1,25 @@
+import pytest
+
+from ...executables import ExecutableRegistry
+from ...pipeline import Pipeline
+from . import in_temp_directory
+
+
+def test_registry():
+    registry = ExecutableRegistry()
+    assert registry.check(["refmacat", "cbuccaneer", "not-a-program"]) == [
+        "not-a-program"
+    ]
+    assert registry.get("refmacat") is registry.get("refmacat")
+    report = registry.report()
+    assert report["refmacat"]["version"]
+    assert report["not-a-program"]["path"] is None
+
+
+@in_temp_directory
+def test_missing_executable():
+    pipeline = Pipeline(json_name="modelcraft.json", executables=ExecutableRegistry())
+    pipeline.start_time = 0
+    with pytest.raises(SystemExit):
+        pipeline.check_executables(["refmacat", "not-a-program"])
+    assert "refmacat" in pipeline.report["executables"]
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import time
+
+from ...executor import SpoolExecutor
+from ...pipeline import Pipeline
+from . import in_temp_directory, insulin_refmac_job
+
+
+def _worker() -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "modelcraft.scripts.worker", "spool"]
+        + ["--poll", "0.1", "--exit-when-idle", "5"]
+    )
+
+
+@in_temp_directory
+def test_spool_executor():
+    workers = [_worker() for _ in range(2)]
+    executor = SpoolExecutor("spool", poll_seconds=0.1)
+    pipeline = Pipeline(parallel_jobs=2, executor=executor)
+    jobs = [insulin_refmac_job(cycles) for cycles in (0, 2)]
+    result0, result1 = pipeline.run_jobs(*jobs)
+    assert result1.rwork < result0.rwork
+    assert pipeline.report["jobs"][0]["resources"]["user_seconds"] > 0
+    for worker in workers:
+        assert worker.wait() == 0
+    assert os.listdir(os.path.join("spool", "done")) == []
+
+
+@in_temp_directory
+def test_dead_worker_resubmitted():
+    executor = SpoolExecutor("spool", poll_seconds=0.1, stale_seconds=1)
+    pipeline = Pipeline(executor=executor)
+    job = insulin_refmac_job()
+
+    def claim_and_die():
+        # Claim the ticket like a worker that is then killed before it finishes
+        pending = os.path.join("spool", "pending")
+        while not os.listdir(pending):
+            time.sleep(0.1)
+        ticket = os.listdir(pending)[0]
+        os.rename(
+            os.path.join(pending, ticket), os.path.join("spool", "running", ticket)
+        )
+        return _worker()
+
+    worker, result = pipeline.run_parallel(claim_and_die, lambda: job.run(pipeline))
+    assert result.rfree > 0
+    assert worker.wait() == 0
+    assert os.listdir(os.path.join("spool", "running")) == []
@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+import os
+
+import pytest
+
+from ...pipeline import Pipeline
+from ...trace import span
+from . import in_temp_directory, insulin_refmac_job
+
+
+def test_run_async():
+    result = asyncio.run(insulin_refmac_job(cycles=1).run_async())
+    assert result.rwork < result.initial_rwork
+
+
+@in_temp_directory
+def test_pipeline_run_jobs():
+    pipeline = Pipeline()
+    result0, result1 = pipeline.run_jobs(
+        insulin_refmac_job(), insulin_refmac_job(cycles=2)
+    )
+    assert result1.rwork < result0.rwork
+    assert "running_job" not in pipeline.report
+    assert len(pipeline.report["jobs"]) == 2
+
+
+@in_temp_directory
+def test_job_resources():
+    pipeline = Pipeline()
+    insulin_refmac_job().run(pipeline)
+    assert pipeline.report["jobs"][0]["resources"]["user_seconds"] > 0
+    assert pipeline.report["resources"]["refmacat"]["jobs"] == 1
+    assert pipeline.report["resources"]["refmacat"]["max_rss_kb"] > 0
+
+
+@in_temp_directory
+def test_pipeline_run_parallel():
+    pipeline = Pipeline(parallel_jobs=1)
+    result0, result1 = pipeline.run_parallel(
+        insulin_refmac_job().run, lambda: insulin_refmac_job(cycles=1).run(pipeline)
+    )
+    assert result1.rwork < result0.rwork
+    assert len(pipeline.report["jobs"]) == 1
+
+
+@in_temp_directory
+def test_more_jobs_than_default_threads():
+    pipeline = Pipeline(parallel_jobs=1)
+    count = min(32, (os.cpu_count() or 1) + 4) + 1
+    runs = [lambda: insulin_refmac_job().run(pipeline) for _ in range(count)]
+    results = pipeline.run_parallel(*runs)
+    assert len(results) == count
+    assert pipeline.report["resources"]["refmacat"]["jobs"] == count
+
+
+@in_temp_directory
+def test_scratch_directory():
+    os.mkdir("scratch")
+    pipeline = Pipeline(
+        directory="output",
+        keep_logs=True,
+        scratch_directory=os.path.abspath("scratch"),
+    )
+    os.mkdir("output")
+    insulin_refmac_job().run(pipeline)
+    pipeline.clean_scratch()
+    assert os.listdir("scratch") == []
+    logs = os.listdir(os.path.join("output", "modelcraft-logs"))
+    assert "job_1_refmacat_stdout.txt" in logs
+
+
+@in_temp_directory
+def test_job_timeout():
+    pipeline = Pipeline(job_timeout=0.1)
+    with pytest.raises(TimeoutError):
+        insulin_refmac_job(cycles=50).run(pipeline)
+    assert pipeline.processes == set()
+
+
+@in_temp_directory
+def test_shared_inputs():
+    pipeline = Pipeline(keep_jobs=True)
+    insulin_refmac_job().run(pipeline)
+    insulin_refmac_job(cycles=1).run(pipeline)
+    stat1 = os.stat(os.path.join("job_1_refmacat", "hklin.mtz"))
+    stat2 = os.stat(os.path.join("job_2_refmacat", "hklin.mtz"))
+    assert stat1.st_ino == stat2.st_ino
+    assert stat1.st_nlink == 3
+
+
+@in_temp_directory
+def test_unused_inputs_removed():
+    pipeline = Pipeline()
+    result = insulin_refmac_job().run(pipeline)
+    assert os.listdir("modelcraft-artifacts")
+    del result
+    assert os.listdir("modelcraft-artifacts") == []
+
+
+@in_temp_directory
+def test_standalone_files_removed():
+    result = insulin_refmac_job().run()
+    assert os.listdir(".") == []
+    assert result.structure is not None
+
+
+@in_temp_directory
+def test_lazy_fields_after_chdir():
+    pipeline = Pipeline()
+    result = insulin_refmac_job().run(pipeline)
+    os.mkdir("elsewhere")
+    os.chdir("elsewhere")
+    try:
+        assert result.structure is not None
+    finally:
+        os.chdir("..")
+
+
+@in_temp_directory
+def test_checkpoint():
+    pipeline = Pipeline()
+    pipeline.report["args"] = ["xray", "--cycles", "5"]
+    result = insulin_refmac_job().run(pipeline)
+    pipeline.save_checkpoint("cycle", {"cycle": 1, "refmac": result})
+    resumed = Pipeline()
+    resumed.report["args"] = ["xray", "--cycles", "5", "--resume"]
+    state = resumed.load_checkpoint("cycle")
+    assert state["cycle"] == 1
+    assert state["refmac"].rfree == result.rfree
+    assert state["refmac"].fphi_best.label() == result.fphi_best.label()
+    assert resumed.report["jobs"] == pipeline.report["jobs"]
+    assert resumed.next_job_directory("refmacat") == "job_2_refmacat"
+
+
+@in_temp_directory
+def test_trace():
+    pipeline = Pipeline(trace=True)
+    insulin_refmac_job().run(pipeline)
+    events = {event["name"]: event for event in pipeline.tracer.events}
+    job = events["refmacat"]
+    write = events["write_mmcif"]
+    assert job["args"]["directory"] == "job_1_refmacat"
+    assert job["ts"] <= write["ts"] <= job["ts"] + job["dur"]
+
+
+@in_temp_directory
+def test_trace_per_pipeline():
+    first = Pipeline(trace=True)
+    second = contextvars.copy_context().run(Pipeline, trace=True)
+    with span("stage"):
+        pass
+    assert [event["name"] for event in first.tracer.events] == ["stage"]
+    assert second.tracer.events == []
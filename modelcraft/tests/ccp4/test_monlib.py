@@ -3,7 +3,7 @@ import math
 import gemmi
 import pytest
 
-from ...monlib import MonLib
+from ...monlib import MonLib, MonLibCache
 from ...sequence import DNA_CODES, PROTEIN_CODES, RNA_CODES
 
 
@@ -89,3 +89,13 @@ def test_not_in_monlib(monlib: MonLib):
 )
 def test_weight(monlib: MonLib, code: str, expected: float):
     assert math.isclose(monlib.weight(code), expected, abs_tol=0.01)
+
+
+def test_monlib_cache():
+    cache = MonLibCache()
+    monlib = cache.get(["COM", "2GP"], include_standard=True)
+    assert cache.get({"COM"}, include_standard=True) is monlib
+    assert cache.get({"COM"}) is not monlib
+    larger = cache.get({"COM", "GOL"}, include_standard=True)
+    assert "2GP" in larger
+    assert "GOL" in larger
@@ -2,6 +2,7 @@ import gemmi
 
 from ...contents import AsuContents
 from ...jobs.parrot import Parrot
+from ...maps import skewness
 from ...reflections import DataItem
 from . import ccp4_path
 
@@ -18,3 +19,17 @@ def test_parrot_after_parrot():
     parrot2 = Parrot(contents, fsigf, freer, parrot1.abcd, parrot1.fphi).run()
     assert parrot2.abcd.nreflections == freer.nreflections
     assert parrot2.fphi.nreflections == freer.nreflections
+
+
+def test_parrot_solvent_content():
+    mtz_path = ccp4_path("examples", "data", "gere.mtz")
+    seq_path = ccp4_path("examples", "data", "gere.pir")
+    contents = AsuContents.from_file(seq_path)
+    mtz = gemmi.read_mtz_file(mtz_path)
+    fsigf = DataItem(mtz, "FPHASED,SIGFPHASED")
+    freer = DataItem(mtz, "FreeR_flag")
+    phases = DataItem(mtz, "HLA,HLB,HLC,HLD")
+    job = Parrot(contents, fsigf, freer, phases, solvent_content=0.6)
+    parrot = job.run()
+    assert job._args[job._args.index("-solvent-content") + 1] == "0.600"
+    assert skewness(parrot.fphi.map()) > 0
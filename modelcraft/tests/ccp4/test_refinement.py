@@ -0,0 +1,30 @@
+from ...refinement import AdaptiveCycles, ResolutionRamp
+
+
+def test_adaptive_cycles():
+    cycles = AdaptiveCycles(minimum=2, maximum=12, tolerance=0.001)
+    assert cycles.choose("buccaneer", 10) == 10
+    assert cycles.record("buccaneer", [0.40, 0.35, 0.33, 0.3295, 0.3293, 0.3292]) == 3
+    assert cycles.choose("buccaneer", 10) == 3
+    assert cycles.record("waters", [0.30, 0.29, 0.28, 0.27]) == 5
+    assert cycles.choose("waters", 10) == 5
+    assert cycles.record("waters", [0.30, 0.30]) == 1
+    assert cycles.choose("waters", 10) == 5
+    assert cycles.record("prune", [0.3] + [0.3 - 0.01 * i for i in range(1, 11)]) == 15
+    assert cycles.choose("prune", 5) == 12
+
+
+def test_resolution_ramp():
+    ramp = ResolutionRamp(start=3.0, full=1.5)
+    assert ramp.limit == 3.0
+    assert not ramp.update(0.50, improved=True)
+    assert ramp.update(0.44, improved=True)
+    assert ramp.limit == 2.25
+    assert not ramp.update(0.40, improved=True)
+    assert ramp.update(0.40, improved=False)
+    assert ramp.limit == 1.5
+    assert ramp.finished
+    assert not ramp.update(0.30, improved=False)
+    ramp = ResolutionRamp(start=3.0, full=1.5)
+    assert ramp.update(0.30, improved=True)
+    assert ramp.finished
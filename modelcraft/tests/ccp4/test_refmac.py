@@ -1,11 +1,14 @@
 import math
+import os
 
 import gemmi
 
 from ...jobs.refmac import Refmac
+from ...lazy import is_loaded, load_all
+from ...pipeline import Pipeline
 from ...reflections import DataItem
 from ...structure import read_structure
-from . import ccp4_path
+from . import ccp4_path, in_temp_directory, insulin_freer, insulin_fsigf
 
 
 def test_1rxf():
@@ -23,5 +26,38 @@ def test_1rxf():
     assert refmac.rwork < refmac.initial_rwork
     assert refmac.rfree < refmac.initial_rfree
     assert refmac.fsc > refmac.initial_fsc
+    assert refmac.rfrees == [refmac.initial_rfree, refmac.rfree]
     assert math.isclose(refmac.data_completeness, 95.261, abs_tol=0.01)
     assert math.isclose(refmac.resolution_high, 1.501, abs_tol=0.01)
+
+
+def test_1rxf_convergence():
+    pdb_path = ccp4_path("examples", "data", "1rxf_randomise.pdb")
+    structure = read_structure(pdb_path)
+    mtz_path = ccp4_path("examples", "data", "1rxf.mtz")
+    mtz = gemmi.read_mtz_file(mtz_path)
+    fsigf = DataItem(mtz, "F,SIGF")
+    freer = DataItem(mtz, "FreeR_flag")
+    refmac = Refmac(
+        structure=structure,
+        fsigf=fsigf,
+        freer=freer,
+        cycles=20,
+        convergence_tolerance=0.01,
+    ).run()
+    assert refmac.cycles < 20
+    assert refmac.rfree < refmac.initial_rfree
+
+
+@in_temp_directory
+def test_lazy_result():
+    structure = read_structure(ccp4_path("examples", "data", "insulin.pdb"))
+    refmac = Refmac(
+        structure=structure, fsigf=insulin_fsigf(), freer=insulin_freer(), cycles=0
+    ).run(Pipeline())
+    assert not is_loaded(refmac, "structure")
+    assert os.path.isdir("job_1_refmacat")
+    load_all(refmac)
+    assert refmac.structure is not None
+    assert refmac.abcd.label() == "HLACOMB,HLBCOMB,HLCCOMB,HLDCOMB"
+    assert not os.path.exists("job_1_refmacat")
@@ -0,0 +1,32 @@
+import dataclasses
+import os
+
+from ...lazy import is_loaded
+from ...results import ResultStore, resident_bytes
+from . import in_temp_directory, insulin_refmac
+
+
+@in_temp_directory
+def test_spill_and_reload():
+    older = dataclasses.replace(insulin_refmac())
+    newer = dataclasses.replace(insulin_refmac())
+    size = resident_bytes(older)
+    store = ResultStore("results", max_bytes=size)
+    store.add(older)
+    assert store.spilled == 0
+    store.add(newer)
+    assert store.spilled == 1
+    assert not is_loaded(older, "structure")
+    assert is_loaded(newer, "structure")
+    assert len(os.listdir("results")) == 1
+    assert older.fphi_best.label() == "FWT,PHWT"
+    assert older.fphi_best.nreflections == insulin_refmac().fphi_best.nreflections
+    assert older.structure[0].count_atom_sites() > 0
+    assert older.mtz is not None
+    assert older.abcd is not None
+    assert older.fphi_diff is not None
+    assert older.fphi_calc is not None
+    assert resident_bytes(older) == size
+    assert not os.listdir("results")
+    store.remove()
+    assert not os.path.exists("results")
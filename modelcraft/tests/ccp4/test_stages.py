@@ -0,0 +1,66 @@
+import json
+import threading
+import time
+
+from ...stages import StageGraph, StageUtility
+
+
+def test_stage_order():
+    graph = StageGraph()
+    order = []
+    graph.add("a", lambda: order.append("a"), outputs=("x",))
+    graph.add("b", lambda: order.append("b"), inputs=("x",))
+    graph.add("c", lambda: order.append("c"), inputs=("x",))
+    graph.add("d", lambda: order.append("d"), outputs=("x",))
+    assert graph.stages[1].dependencies == {"a"}
+    assert graph.stages[3].dependencies == {"a", "b", "c"}
+    graph.run(budget=1)
+    assert order == ["a", "b", "c", "d"]
+
+
+def test_stage_parallel():
+    graph = StageGraph()
+    barrier = threading.Barrier(2, timeout=5)
+
+    def wait_and_return(value):
+        barrier.wait()
+        return value
+
+    graph.add("first", lambda: wait_and_return(1), inputs=("model",))
+    graph.add("second", lambda: wait_and_return(2), inputs=("model",))
+    graph.add(
+        "sum",
+        lambda: graph.results["first"] + graph.results["second"],
+        inputs=("first", "second"),
+    )
+    start = time.time()
+    assert graph.run(budget=2)["sum"] == 3
+    assert time.time() - start < 5
+
+
+def test_stage_utility():
+    utility = StageUtility(min_gain_per_minute=0.001)
+    utility.record("waters", cycle=1, gain=0.01, seconds=60)
+    utility.record("waters", cycle=2, gain=0, seconds=60)
+    assert not utility.skip("waters", 3)
+    utility.record("waters", cycle=3, gain=-0.001, seconds=60)
+    assert utility.skip("waters", 4)
+    assert utility.skip("waters", 5)
+    assert not utility.skip("waters", 6)
+    utility.record("waters", cycle=6, gain=0, seconds=60)
+    assert utility.skip("waters", 10)
+    assert not utility.skip("waters", 11)
+    assert not utility.skip("prune_chains", 4)
+    assert len(utility.history["waters"]) == 4
+
+
+def test_stage_utility_replay():
+    utility = StageUtility(min_gain_per_minute=0.001)
+    utility.record("waters", cycle=1, gain=0, seconds=60)
+    utility.record("waters", cycle=2, gain=0, seconds=60)
+    history = json.loads(json.dumps(utility.history))
+    resumed = StageUtility(min_gain_per_minute=0.001)
+    resumed.replay(history)
+    assert resumed.skip("waters", 4)
+    assert not resumed.skip("waters", 5)
+    assert resumed.history == utility.history
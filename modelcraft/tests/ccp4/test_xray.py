@@ -35,6 +35,7 @@ def test_insulin_from_phases():
     args += ["--cycles", "1"]
     args += ["--directory", "my_modelcraft_dir"]
     args += ["--overwrite-directory"]
+    args += ["--metrics-file", "modelcraft.prom"]
     with pytest.raises(SystemExit):
         main(args)
     report_path = os.path.join("my_modelcraft_dir", "modelcraft.json")
@@ -42,6 +43,18 @@ def test_insulin_from_phases():
         report = json.load(report_file)
     assert report["seconds"]["total"] > 0
     assert report["termination_reason"] == "Normal"
+    events_path = os.path.join("my_modelcraft_dir", "modelcraft.events.jsonl")
+    with open(events_path, encoding="utf-8") as events_file:
+        events = [json.loads(line) for line in events_file]
+    assert sum(event["event"] == "job_finish" for event in events) == len(
+        report["jobs"]
+    )
+    assert [event for event in events if event["event"] == "cycle"][0]["cycle"] == 1
+    assert events[-1]["event"] == "termination"
+    with open("modelcraft.prom", encoding="utf-8") as metrics_file:
+        metrics = metrics_file.read()
+    assert "modelcraft_best_r_free{" in metrics
+    assert 'modelcraft_finished{directory="' in metrics
     mtz_path = os.path.join("my_modelcraft_dir", "modelcraft.mtz")
     mtz = gemmi.read_mtz_file(mtz_path)
     columns = set(mtz.column_labels())
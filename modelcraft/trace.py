@@ -0,0 +1,76 @@
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+
+class Tracer:
+    "Nested timing spans that can be written in the Chrome trace event format"
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, lane: Optional[int] = None, **args):
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident() if lane is None else lane,
+                "args": args,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def write(self, path: str) -> None:
+        with self._lock:
+            trace = {"traceEvents": list(self.events), "displayTimeUnit": "ms"}
+        with open(path, "w", encoding="utf-8") as stream:
+            json.dump(trace, stream)
+
+
+# Each pipeline (e.g. each dataset in batch mode) records to its own tracer
+_TRACER = contextvars.ContextVar("tracer", default=None)
+
+
+def start_tracing(enabled: bool = True) -> Optional[Tracer]:
+    "Record spans in the current context to a new tracer (or stop recording them)"
+    tracer = Tracer() if enabled else None
+    _TRACER.set(tracer)
+    return tracer
+
+
+def span(name: str, category: str = "stage", lane: Optional[int] = None, **args):
+    "Context manager that records a span (if tracing) and yields its details dict"
+    tracer = _TRACER.get()
+    if tracer is None:
+        return contextlib.nullcontext({})
+    return tracer.span(name, category, lane, **args)
+
+
+def traced(category: str = "python"):
+    "Decorator that records a span for each call if tracing has been started"
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(function.__name__, category):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,5 +1,6 @@
 from random import choice
 from string import ascii_letters, digits
+from typing import Optional
 
 import numpy as np
 
@@ -16,3 +17,11 @@ def puid(length: int = 10) -> str:
     "Probably unique identifier"
     chars = ascii_letters + digits
     return "".join(choice(chars) for _ in range(length))
+
+
+def minutes_to_seconds(minutes: Optional[float]) -> Optional[float]:
+    return None if minutes is None else minutes * 60
+
+
+def gigabytes_to_bytes(gigabytes: Optional[float]) -> Optional[int]:
+    return None if gigabytes is None else int(gigabytes * 1e9)
@@ -8,9 +8,11 @@ from .geometry import per_residue_geometry_rmsz
 from .jobs.refmac import RefmacResult
 from .monlib import MonLib
 from .reflections import DataItem
+from .trace import traced
 from .utils import modified_zscore
 
 
+@traced()
 def validate(
     structure: gemmi.Structure,
     fphi_best: DataItem,